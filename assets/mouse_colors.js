@@ -0,0 +1,76 @@
+// Clientside callbacks of the mouse page (see code/pages/mouse.py).
+// The figures never leave the browser: only the edited figure is returned, the others are left untouched.
+
+window.dash_clientside = Object.assign({}, window.dash_clientside, {
+    mouse: {
+        // List the traces of the selected graph for the trace dropdown.
+        traceOptions: function(selectedGraph, figFull, figIntervalOn, figIntervalOff, figChange, figSeparated) {
+            const figures = {
+                full: figFull,
+                interval_on: figIntervalOn,
+                interval_off: figIntervalOff,
+                avg_change: figChange,
+                separated: figSeparated
+            };
+            const fig = figures[selectedGraph] || figFull;
+            if (!fig || !fig.data) {
+                return [];
+            }
+            // event shading is drawn as band traces, so it is listed with the other traces
+            return fig.data.map((trace, i) => ({
+                label: trace.name !== undefined ? trace.name : `Trace ${i + 1}`,
+                value: i
+            }));
+        },
+
+        // Change the color of one trace of the selected graph.
+        updateTraceColor: function(colorValue, selectedGraph, selectedTrace,
+                                   figFull, figIntervalOn, figIntervalOff, figChange, figSeparated) {
+            const noUpdate = window.dash_clientside.no_update;
+            const graphs = ['full', 'interval_on', 'interval_off', 'avg_change', 'separated'];
+            const figures = [figFull, figIntervalOn, figIntervalOff, figChange, figSeparated];
+            const outputs = graphs.map(() => noUpdate);
+
+            const index = graphs.indexOf(selectedGraph);
+            if (selectedTrace === null || selectedTrace === undefined || !colorValue || index < 0) {
+                return outputs;
+            }
+            const fig = figures[index];
+            if (!fig || !fig.data || fig.data.length <= selectedTrace) {
+                return outputs;
+            }
+
+            const rgb = colorValue.rgb || {};
+            const r = rgb.r || 0, g = rgb.g || 0, b = rgb.b || 0;
+            const a = rgb.a === undefined ? 1 : rgb.a;
+            const newColor = `rgba(${r},${g},${b},${a})`;
+
+            const trace = Object.assign({}, fig.data[selectedTrace]);
+            const setColor = (key) => {
+                trace[key] = Object.assign({}, trace[key], {color: newColor});
+            };
+
+            if (selectedGraph === 'avg_change' && trace.type === 'box') {
+                // Update both the marker (dots) and line (box outline) colors, fill with a fixed alpha
+                setColor('marker');
+                setColor('line');
+                trace.fillcolor = `rgba(${r},${g},${b},0.2)`;
+            } else if (selectedGraph === 'avg_change' && trace.type === 'bar') {
+                setColor('marker');
+            } else if ('line' in trace) {
+                setColor('line');
+            } else {
+                setColor('marker');
+            }
+            // event bands are filled traces
+            if (trace.fill === 'toself') {
+                trace.fillcolor = newColor;
+            }
+
+            const data = fig.data.slice();
+            data[selectedTrace] = trace;
+            outputs[index] = Object.assign({}, fig, {data: data});
+            return outputs;
+        }
+    }
+});
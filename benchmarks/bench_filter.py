@@ -0,0 +1,69 @@
+"""
+Compare the zero-phase filtering of 16 channels of a one-hour recording: a single sosfiltfilt call on a
+2D array of all channels (as before) against PhotometryDataset.filter_signals, which filters one column
+at a time with the shared filter design.
+
+Run from the repository root:
+    python benchmarks/bench_filter.py
+"""
+import os
+import sys
+import time
+import tracemalloc
+import numpy as np
+import pandas as pd
+from scipy.signal import sosfiltfilt
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from code.dataset import PhotometryDataset
+
+CHANNELS = 16
+
+
+def recording(seconds=3600, fps=93, seed=0):
+    """
+    Build a photometry dataset of CHANNELS random channels with the default low-pass filter.
+    """
+    rng = np.random.default_rng(seed)
+    photometry = PhotometryDataset.__new__(PhotometryDataset)
+    photometry.df = pd.DataFrame({f'channel{i}': rng.standard_normal(seconds * fps) for i in range(CHANNELS)})
+    photometry.cutoff, photometry.fps, photometry.filter_type, photometry.filter_order = 1.7, fps, 'low', 2
+    photometry.notch, photometry.notch_q = None, 30
+    photometry.sos = photometry.design_filter()
+    return photometry
+
+
+def filter_2d(photometry, columns):
+    # filter_signals before the per-column loop
+    data = np.ascontiguousarray(photometry.df[columns].to_numpy(dtype=np.float64).T)
+    filtered = sosfiltfilt(photometry.sos, data, axis=-1)
+    for i, col in enumerate(columns):
+        photometry.df[col] = filtered[i]
+
+
+def measure(func, repeat=5):
+    """
+    Return the shortest run time and the peak memory of func on fresh copies of the recording.
+    """
+    columns = [f'channel{i}' for i in range(CHANNELS)]
+    best = float('inf')
+    for _ in range(repeat):
+        photometry = recording()
+        start = time.perf_counter()
+        func(photometry, columns)
+        best = min(best, time.perf_counter() - start)
+    photometry = recording()
+    tracemalloc.start()
+    func(photometry, columns)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return best, peak, photometry.df
+
+
+if __name__ == '__main__':
+    seconds_2d, peak_2d, df_2d = measure(filter_2d)
+    seconds_col, peak_col, df_col = measure(lambda photometry, columns: photometry.filter_signals(columns))
+    print(f"{CHANNELS} channels, {len(df_2d)} samples each")
+    print(f"{'2D array':<20} {seconds_2d:7.3f} s  peak {peak_2d / 1e6:6.1f} MB")
+    print(f"{'per column':<20} {seconds_col:7.3f} s  peak {peak_col / 1e6:6.1f} MB")
+    assert np.allclose(df_2d.to_numpy(), df_col.to_numpy()), "The filtered channels differ"
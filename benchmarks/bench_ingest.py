@@ -0,0 +1,95 @@
+"""
+Compare the CSV ingest of a one-hour session: reading whole files with inferred types (as before)
+against read_photometry_csv and read_behavior_csv, which only read the used columns with fixed dtypes.
+The new reads run with the c engine and with the engine chosen by default (pyarrow when it is installed).
+
+Run from the repository root:
+    python benchmarks/bench_ingest.py
+"""
+import contextlib
+import io
+import os
+import sys
+import tempfile
+import time
+import warnings
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from code.dataset import read_photometry_csv, read_behavior_csv, CSV_ENGINE
+from code.cache import COLUMN_MAP
+
+BODY_PARTS = ['head', 'ear L', 'ear R', 'middle tail', 'base tail', 'tail end']
+
+
+def write_session(folder, seconds=3600, photometry_rate=93, behavior_fps=30, seed=0):
+    """
+    Write a photometry recording (12 columns) and a DeepLabCut behavior file (6 body parts) of the given length.
+    """
+    rng = np.random.default_rng(seed)
+    n = seconds * photometry_rate
+    recording = {'Time(s)': np.arange(n) / photometry_rate, 'DI/O-1': (rng.random(n) > 0.5).astype(int)}
+    for col in ['channel1_410', 'channel1_470', 'channel2_410', 'channel2_470', 'channel3_410', 'channel3_470',
+                'AIn-1', 'AIn-2', 'DI/O-2', 'DI/O-3']:
+        recording[col] = rng.random(n)
+    photometry_path = os.path.join(folder, 'recording.csv')
+    pd.DataFrame(recording).to_csv(photometry_path, index=False)
+
+    m = seconds * behavior_fps
+    behavior_path = os.path.join(folder, 'behavior.csv')
+    with open(behavior_path, 'w') as f:
+        f.write('scorer,' + ','.join(['DLC'] * 3 * len(BODY_PARTS)) + '\n')
+        f.write('bodyparts,' + ','.join(part for part in BODY_PARTS for _ in range(3)) + '\n')
+        f.write('coords,' + ','.join(['x', 'y', 'likelihood'] * len(BODY_PARTS)) + '\n')
+        pd.DataFrame(rng.random((m, 3 * len(BODY_PARTS))) * 500).to_csv(f, header=False)
+    return photometry_path, behavior_path
+
+
+def old_photometry(path):
+    # PhotometryDataset before the column selection
+    return pd.read_csv(path).rename(columns=COLUMN_MAP)
+
+
+def old_behavior(path):
+    # BehaviorDataset before the column selection: string columns converted afterwards
+    df = pd.read_csv(path, header=1)
+    df = df.drop(df.index[0])
+    for col in ['head', 'head.1', 'middle tail', 'middle tail.1', 'base tail', 'base tail.1']:
+        df[col] = df[col].astype(float)
+    return df
+
+
+def best_of(func, repeat=3):
+    """
+    Return the shortest run time of func and its result, without its printed output.
+    """
+    best = float('inf')
+    for _ in range(repeat):
+        with contextlib.redirect_stdout(io.StringIO()):
+            start = time.perf_counter()
+            result = func()
+            best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def report(name, seconds, df):
+    print(f"{name:<26} {seconds:7.3f} s  {len(df):7d} rows  {df.memory_usage(deep=True).sum() / 1e6:7.1f} MB in memory")
+
+
+if __name__ == '__main__':
+    # the old behavior read warns about the mixed header and number rows
+    warnings.simplefilter('ignore', pd.errors.DtypeWarning)
+    with tempfile.TemporaryDirectory() as folder:
+        photometry_path, behavior_path = write_session(folder)
+        print(f"Photometry file {os.path.getsize(photometry_path) / 1e6:.1f} MB, "
+              f"behavior file {os.path.getsize(behavior_path) / 1e6:.1f} MB, default engine {CSV_ENGINE}")
+
+        engines = dict.fromkeys(['c', CSV_ENGINE])
+        report('photometry old', *best_of(lambda: old_photometry(photometry_path)))
+        for engine in engines:
+            report(f'photometry new ({engine})',
+                   *best_of(lambda: read_photometry_csv(photometry_path, COLUMN_MAP, engine=engine)[0]))
+        report('behavior old', *best_of(lambda: old_behavior(behavior_path)))
+        for engine in engines:
+            report(f'behavior new ({engine})', *best_of(lambda: read_behavior_csv(behavior_path, engine=engine)[0]))
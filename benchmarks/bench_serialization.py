@@ -0,0 +1,79 @@
+"""
+Compare the serialization of a merged one-hour session: the former dataframe dictionary in JSON
+against the binary column encoding (MergeDatasets.to_dict with base64, and to_bytes/from_bytes).
+
+Run from the repository root:
+    python benchmarks/bench_serialization.py
+"""
+import json
+import os
+import sys
+import time
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from code.dataset import MergeDatasets
+
+
+def one_hour_session(fps=30, seconds=3600, seed=0):
+    """
+    Build a merged dataset with the columns of a processed session (two regions, three body parts).
+    """
+    n = fps * seconds
+    rng = np.random.default_rng(seed)
+    df = pd.DataFrame({'Time(s)': np.arange(n) / fps, 'DI/O-1': (rng.random(n) > 0.5).astype(np.float32)})
+    for region in ['ACC', 'ADN']:
+        for col in ['control', 'signal', 'zdFF']:
+            df[f'{region}.{col}'] = rng.standard_normal(n)
+    for part in ['head', 'tail', 'base']:
+        df[f'{part}_x'] = rng.random(n) * 500
+        df[f'{part}_y'] = rng.random(n) * 500
+    df['freezing'] = rng.random(n) > 0.5
+
+    merged = MergeDatasets.__new__(MergeDatasets)
+    merged.df = df
+    merged.fps = fps
+    merged.events = ['freezing']
+    merged.event_intervals = {}
+    return merged
+
+
+def best_of(func, repeat=3):
+    """
+    Return the shortest run time of func and its result.
+    """
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def report(name, encode, decode, size):
+    print(f"{name:<26} encode {encode:8.4f} s  decode {decode:8.4f} s  {size / 1e6:6.1f} MB")
+
+
+def legacy_to_dict(merged):
+    # format of MergeDatasets.to_dict before the binary encoding
+    return {'df': merged.df.to_dict(), 'fps': merged.fps, 'events': merged.events}
+
+
+if __name__ == '__main__':
+    merged = one_hour_session()
+    print(f"Session: {len(merged.df)} rows, {len(merged.df.columns)} columns")
+
+    encode, text = best_of(lambda: json.dumps(legacy_to_dict(merged)), repeat=1)
+    decode, _ = best_of(lambda: MergeDatasets.from_dict(json.loads(text)), repeat=1)
+    report('dataframe dict + JSON', encode, decode, len(text))
+
+    encode, text = best_of(lambda: json.dumps(merged.to_dict()))
+    decode, _ = best_of(lambda: MergeDatasets.from_dict(json.loads(text)))
+    report('to_dict (base64) + JSON', encode, decode, len(text))
+
+    encode, buffer = best_of(lambda: merged.to_bytes())
+    decode, decoded = best_of(lambda: MergeDatasets.from_bytes(buffer))
+    report('to_bytes / from_bytes', encode, decode, len(buffer))
+
+    assert decoded.df.equals(merged.df), "Decoded session differs from the original"
@@ -0,0 +1,62 @@
+"""
+Compare the cost of an event edit for 40 one-hour sessions in the session store: storing every
+version whole (as for datasets without a session cache file) against storing only the event
+columns next to the cache file the other columns are read from.
+
+Run from the repository root:
+    python benchmarks/bench_store.py
+"""
+import contextlib
+import io
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from bench_serialization import one_hour_session
+from code.cache import write_session, read_session
+from code.store import SessionStore
+
+MICE = 40
+EVENTS = {'tone': [{'start': 10, 'end': 20}, {'start': 100, 'end': 130}]}
+
+
+def folder_size(path):
+    return sum(os.path.getsize(os.path.join(d, f)) for d, _, files in os.walk(path) for f in files)
+
+
+def edit_events(store, sessions, whole):
+    """
+    Add the events to a copy of every session and store it, return the seconds taken.
+    """
+    start = time.perf_counter()
+    for mouse, session in sessions.items():
+        merged = session.copy()
+        if whole:
+            merged.source = None
+        with contextlib.redirect_stdout(io.StringIO()):
+            merged.apply_events(EVENTS)
+        store.put('session', mouse, merged)
+    return time.perf_counter() - start
+
+
+if __name__ == '__main__':
+    folder = tempfile.mkdtemp()
+    try:
+        os.makedirs(os.path.join(folder, 'cache'))
+        sessions = {}
+        for i in range(MICE):
+            path = os.path.join(folder, 'cache', f'mouse{i}.bin')
+            write_session(path, one_hour_session(seed=i))
+            sessions[f'mouse{i}'] = read_session(path)
+        print(f"{MICE} sessions of {len(sessions['mouse0'].df)} rows, "
+              f"{os.path.getsize(sessions['mouse0'].source) / 1e6:.1f} MB each in the cache")
+
+        for name, whole in [('whole versions', True), ('event columns only', False)]:
+            store = SessionStore(session_dir=os.path.join(folder, 'sessions-' + name.split()[0]))
+            seconds = edit_events(store, sessions, whole)
+            print(f"{name:<20} {seconds:7.3f} s  {folder_size(store.session_dir) / 1e6:7.1f} MB written")
+    finally:
+        shutil.rmtree(folder)
@@ -1,9 +1,11 @@
 import os
 import sys
 import time
+import multiprocessing
 import webbrowser
 import dash
 import random
+import uuid
 from dash import dcc, html
 from dash.dependencies import Input, Output, State
 from dash_local_react_components import load_react_component
@@ -51,18 +53,25 @@ else:
     base_path = os.path.dirname(os.path.abspath(__file__))
 
 
-def load_raw_data(data_dir):
-    """Load raw merged data for all mice and store in mouse_data."""
+def load_raw_data(data_dir, group_store=None):
+    """Load raw merged data for all mice and store in mouse_data.
+
+    Existing group_store entries are kept (so group changes survive a rescan), entries of deleted
+    folders are dropped and only new folders get a group and color.
+    """
     mouse_data = {}
+    previous = group_store or {}
     group_store = {}
-    _color = {}
+    _color = {entry['group']: entry['color'] for entry in previous.values() if 'group' in entry}
     # Detect available mouse folders
     mouse_folders = [d for d in os.listdir(data_dir) if os.path.isdir(os.path.join(data_dir, d))]
     for mouse in mouse_folders:
             mouse_data[mouse] = []
-            if '_' in mouse:
+            if mouse in previous:
+                group_store[mouse] = previous[mouse]
+            elif '_' in mouse:
                 group = mouse.split('_')[-1]
-                if group in _color.values():
+                if group in _color:
                     color = _color[group]
                 else:
                     # pick random color
@@ -113,7 +122,11 @@ app.layout = html.Div([
     # Store component to persist state
     dcc.Store(id='app-state', data={}, storage_type='session'),
     dcc.Store(id='selected-folder', storage_type='session'),
+    dcc.Store(id='session-id', storage_type='session'),
+    # Only holds handles to the datasets kept in the server-side session store
     dcc.Store(id='mouse-data-store', storage_type='session'),
+    # Mice whose sessions were processed by the background job of the home page
+    dcc.Store(id='processed-store', storage_type='session'),
     dcc.Store(id='event-store', data={}, storage_type='session'),
     dcc.Store(id='event-colors', data={}, storage_type='session'),
     dcc.Store(id='group-store', data={}, storage_type='session'),
@@ -158,20 +171,34 @@ app.index_string = '''
      Output('submit-path', 'n_clicks')],
     [Input('submit-path', 'n_clicks')],
     [State('app-state', 'data'),
-    State('input-path', 'value')],
+    State('input-path', 'value'),
+    State('group-store', 'data')],
     prevent_initial_call=True
 )
-def update_app_state(n_clicks, data, input_value):
+def update_app_state(n_clicks, data, input_value, group_store):
     # if already data in the app state, return it
     if n_clicks > 0 and input_value:
-        mouse_data, group_store = load_raw_data(input_value)
-        return {'mouse_data': mouse_data}, group_store, 0
+        # a rescan of the same folder keeps the groups of the known mice
+        same_folder = data and data.get('folder') == input_value
+        mouse_data, group_store = load_raw_data(input_value, group_store if same_folder else None)
+        return {'mouse_data': mouse_data, 'folder': input_value}, group_store, 0
     elif data:
         if n_clicks > 0:
             return data, dash.no_update, 0
         return dash.no_update, dash.no_update, 0
     return {}, dash.no_update, 0
 
+@app.callback(
+    Output('session-id', 'data'),
+    Input('url', 'pathname'),
+    State('session-id', 'data')
+)
+def init_session_id(pathname, session_id):
+    # the session id keys this browser session's datasets in the server-side store
+    if session_id:
+        return dash.no_update
+    return uuid.uuid4().hex
+
 @app.callback(
     Output('mouse-dropdown', 'options'),
     Input('app-state', 'data')
@@ -209,6 +236,8 @@ def update_dropdown_value(pathname, options):
 
 
 if __name__ == '__main__':
+    # needed by the worker processes that load mice in the frozen executable
+    multiprocessing.freeze_support()
     time.sleep(1)
     webbrowser.open("http://127.0.0.1:8050/")
     app.run_server(debug=False, port=8050)
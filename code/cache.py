@@ -0,0 +1,496 @@
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import numpy as np
+from code.dataset import PhotometryDataset, BehaviorDataset, MergeDatasets
+from code.memo import LRUCache
+
+# Define the folder holding processed sessions
+CACHE_DIR = os.path.join(os.path.expanduser('~'), '.mousememorygraph', 'cache')
+
+# Define the folder holding the manifests of the scanned data folders
+MANIFEST_DIR = os.path.join(os.path.expanduser('~'), '.mousememorygraph', 'manifests')
+
+# Bump whenever the processing pipeline changes its output so old artifacts are ignored
+CACHE_VERSION = 5
+
+# Number of worker processes used to load mice in parallel (1 loads them one after another)
+LOAD_WORKERS = int(os.environ.get('MMG_LOAD_WORKERS', os.cpu_count() or 1))
+# TTL synchronization of the behavior timeline: unset, 'offset' or 'warp' (see MergeDatasets.sync_time)
+SYNC = os.environ.get('MMG_SYNC') or None
+
+# Channel names of the photometry recordings
+COLUMN_MAP = {
+    "channel1_410": "ACC.control",
+    "channel1_470": "ACC.signal",
+    "channel2_410": "ADN.control",
+    "channel2_470": "ADN.signal"
+}
+
+# (path, size, mtime) -> content hash, so unchanged CSVs are only hashed once per process
+_hash_memo = {}
+
+
+def file_hash(path, chunk_size=1 << 20):
+    """
+    Compute the SHA-1 of a file's content. The result is memoized on the file's
+    size and modification time.
+    """
+    stat = os.stat(path)
+    memo_key = (os.path.abspath(path), stat.st_size, stat.st_mtime_ns)
+    if memo_key in _hash_memo:
+        return _hash_memo[memo_key]
+
+    digest = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    _hash_memo[memo_key] = digest.hexdigest()
+    return _hash_memo[memo_key]
+
+
+def session_key(photometry_path, behavior_path, params):
+    """
+    Build the cache key of a session from the hashes of both CSV files and the processing parameters.
+    """
+    payload = {
+        'version': CACHE_VERSION,
+        'photometry': file_hash(photometry_path),
+        'behavior': file_hash(behavior_path),
+        'params': params
+    }
+    return hashlib.sha1(json.dumps(payload, sort_keys=True).encode()).hexdigest()
+
+
+def write_session(path, merged):
+    """
+    Write a merged dataset to a file (see MergeDatasets.to_bytes). The file is written under a
+    temporary name first and then renamed, so readers never see a partially written session.
+    """
+    fd, tmp = tempfile.mkstemp(prefix='.tmp-', dir=os.path.dirname(path))
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(merged.to_bytes())
+        os.replace(tmp, path)
+    except OSError:
+        os.remove(tmp)
+        raise
+
+
+def read_session(path):
+    """
+    Read a merged dataset written by write_session. The file is memory-mapped, so only the
+    pages that are actually used get read from disk. The path is kept in the source attribute.
+    """
+    merged = MergeDatasets.from_bytes(np.memmap(path, dtype=np.uint8, mode='r'))
+    merged.source = path
+    return merged
+
+
+class SessionCache():
+    """
+    Content-addressed on-disk cache of processed sessions.
+
+    Each mouse folder gets its own cache folder (see folder) and each processed session is stored
+    in a file named after its key (see session_key). Storing a new key for a mouse folder removes
+    the stale ones.
+
+    Args:
+        cache_dir (str): Root folder of the cache.
+    """
+    def __init__(self, cache_dir=CACHE_DIR):
+        self.cache_dir = cache_dir
+
+    def folder(self, mouse_dir):
+        """
+        Name of the cache folder of a mouse folder: its name followed by a hash of its absolute path,
+        so mice of different data folders that share a name (e.g. m1_Recent) do not replace each
+        other's sessions.
+        """
+        mouse_dir = os.path.abspath(mouse_dir)
+        return os.path.basename(mouse_dir) + '-' + hashlib.sha1(mouse_dir.encode()).hexdigest()[:12]
+
+    def path(self, folder, key):
+        return os.path.join(self.cache_dir, folder, key + '.bin')
+
+    def load(self, folder, key):
+        """
+        Load a cached session, or return None if it is not cached.
+        """
+        path = self.path(folder, key)
+        if not os.path.exists(path):
+            return None
+        try:
+            return read_session(path)
+        except (OSError, ValueError, KeyError) as e:
+            print(f"Ignoring broken cache entry {path}: {e}")
+            return None
+
+    def save(self, folder, key, merged):
+        """
+        Store a processed session and remove the stale sessions of the mouse folder.
+        """
+        mouse_dir = os.path.join(self.cache_dir, folder)
+        try:
+            os.makedirs(mouse_dir, exist_ok=True)
+            write_session(self.path(folder, key), merged)
+        except OSError as e:
+            print(f"Could not cache session {folder}: {e}")
+            return
+
+        # invalidate sessions processed from older files or parameters
+        for entry in os.listdir(mouse_dir):
+            path = os.path.join(mouse_dir, entry)
+            if entry == key + '.bin' or entry.startswith('.tmp-'):
+                continue
+            if os.path.isdir(path):
+                shutil.rmtree(path, ignore_errors=True)
+            else:
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+
+
+session_cache = SessionCache()
+
+# Sessions loaded in this process, shared by all pages (MMG_SESSION_MEMO_MB limits their size)
+session_memo = LRUCache(max_items=64, max_bytes=int(os.environ.get('MMG_SESSION_MEMO_MB', 1024)) << 20)
+
+
+def session_nbytes(merged):
+    """
+    Estimate the memory used by the columns of a merged dataset.
+    """
+    return int(merged.df.memory_usage(index=False).sum())
+
+
+def session_params(column_map,
+                   bin_size=0.01,
+                   cutoff=1.7,
+                   fps=100,
+                   behavior_fps=30,
+                   sync=None,
+                   filter_type='low',
+                   filter_order=2,
+                   notch=None,
+                   notch_q=30):
+    """
+    Return the processing parameters of a session as they enter its key (see load_session).
+    """
+    return {
+        'column_map': column_map,
+        'bin_size': bin_size,
+        'cutoff': cutoff,
+        'fps': fps,
+        'behavior_fps': behavior_fps,
+        'sync': sync,
+        'filter_type': filter_type,
+        'filter_order': filter_order,
+        'notch': notch,
+        'notch_q': notch_q
+    }
+
+
+def is_cached(photometry_path, behavior_path, cache=session_cache, **params):
+    """
+    Check whether the processed session of a mouse is in the on-disk cache, without reading it.
+    Takes the load_session arguments (see session_job).
+    """
+    key = session_key(photometry_path, behavior_path, session_params(**params))
+    return os.path.exists(cache.path(cache.folder(os.path.dirname(photometry_path)), key))
+
+
+def load_session(mouse,
+                 photometry_path,
+                 behavior_path,
+                 column_map,
+                 bin_size=0.01,
+                 cutoff=1.7,
+                 fps=100,
+                 behavior_fps=30,
+                 sync=None,
+                 filter_type='low',
+                 filter_order=2,
+                 notch=None,
+                 notch_q=30,
+                 cache=session_cache,
+                 cached_only=False):
+    """
+    Load the processed (normalized and merged) session of a mouse, reading it from the
+    on-disk cache when the CSV files and processing parameters are unchanged.
+
+    Custom events are not part of the cached session and have to be added afterwards.
+    sync selects the TTL synchronization of the behavior timeline (see MergeDatasets.sync_time).
+    filter_type, filter_order, notch and notch_q configure the photometry filter (see PhotometryDataset).
+    With cached_only, None is returned instead of processing an uncached session.
+    """
+    params = session_params(column_map, bin_size=bin_size, cutoff=cutoff, fps=fps, behavior_fps=behavior_fps,
+                            sync=sync, filter_type=filter_type, filter_order=filter_order, notch=notch, notch_q=notch_q)
+    key = session_key(photometry_path, behavior_path, params)
+    folder = cache.folder(os.path.dirname(photometry_path))
+    memo_key = ('load_session', folder, key)
+
+    # sessions already loaded by this process (on any page) are shared
+    merged = session_memo.get(memo_key)
+    if merged is not None:
+        return merged
+
+    merged = cache.load(folder, key)
+    if merged is not None:
+        session_memo.put(memo_key, merged, nbytes=session_nbytes(merged))
+    if merged is not None or cached_only:
+        return merged
+
+    photometry = PhotometryDataset(photometry_path, column_map=column_map, bin_size=bin_size, cutoff=cutoff, fps=fps,
+                                   filter_type=filter_type, filter_order=filter_order, notch=notch, notch_q=notch_q)
+    behavior = BehaviorDataset(behavior_path, fps=behavior_fps)
+    photometry.normalize_signal()
+    merged = MergeDatasets(photometry, behavior, events=['freezing'], sync=sync)
+    cache.save(folder, key, merged)
+
+    # return the cached copy so that both paths give the same column types
+    cached = cache.load(folder, key)
+    merged = cached if cached is not None else merged
+    session_memo.put(memo_key, merged, nbytes=session_nbytes(merged))
+    return merged
+
+
+def session_job(data_dir, mouse, sync=None):
+    """
+    Return the load_session arguments of a mouse folder, or None if one of its CSV files is missing.
+    """
+    photometry_path = os.path.join(data_dir, mouse, f"{mouse.split('_')[0]}_recording.csv.csv")
+    behavior_path = os.path.join(data_dir, mouse, f"{mouse.split('_')[0]}_behavior.csv.csv")
+    if not (os.path.exists(photometry_path) and os.path.exists(behavior_path)):
+        return None
+    return {'photometry_path': photometry_path, 'behavior_path': behavior_path, 'column_map': COLUMN_MAP, 'sync': sync}
+
+
+def folder_manifest(data_dir, mouse, previous=None):
+    """
+    Describe the CSV files of a mouse folder by their size, modification time and content hash,
+    or return None if one of them is missing. The hashes of files whose size and modification
+    time match the previous entry are reused instead of reading the files again.
+    """
+    job = session_job(data_dir, mouse)
+    if job is None:
+        return None
+    entry = {}
+    for name in ('photometry_path', 'behavior_path'):
+        path = job[name]
+        stat = os.stat(path)
+        old = (previous or {}).get(name)
+        if old and old['size'] == stat.st_size and old['mtime'] == stat.st_mtime_ns:
+            # let file_hash (and so session_key) use the known hash
+            _hash_memo[(os.path.abspath(path), stat.st_size, stat.st_mtime_ns)] = old['hash']
+        entry[name] = {'size': stat.st_size, 'mtime': stat.st_mtime_ns, 'hash': file_hash(path)}
+    return entry
+
+
+def _file_hashes(entry):
+    return {name: f['hash'] for name, f in (entry or {}).items()}
+
+
+def manifest_path(data_dir, manifest_dir=MANIFEST_DIR):
+    return os.path.join(manifest_dir, hashlib.sha1(os.path.abspath(data_dir).encode()).hexdigest() + '.json')
+
+
+def load_manifest(data_dir, manifest_dir=MANIFEST_DIR):
+    """
+    Load the manifest of the last scan of a data folder (mouse -> folder_manifest), or an empty one.
+    """
+    try:
+        with open(manifest_path(data_dir, manifest_dir)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def save_manifest(data_dir, manifest, manifest_dir=MANIFEST_DIR):
+    try:
+        os.makedirs(manifest_dir, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(prefix='.tmp-', dir=manifest_dir)
+        with os.fdopen(fd, 'w') as f:
+            json.dump(manifest, f)
+        os.replace(tmp, manifest_path(data_dir, manifest_dir))
+    except OSError as e:
+        print(f"Could not save the manifest of {data_dir}: {e}")
+
+
+def scan_folder(data_dir, mice, manifest_dir=MANIFEST_DIR):
+    """
+    Compare the mouse folders of a data folder with the manifest of its last scan.
+
+    Args:
+        data_dir (str): Data folder.
+        mice (iterable): Mouse folders found in the data folder.
+
+    Returns:
+        manifest (dict): Mouse -> folder_manifest of the current files (None if a file is missing).
+        added (list): Mice that were not in the last scan.
+        changed (list): Mice whose CSV files changed content since the last scan.
+        removed (list): Mice of the last scan whose folder was deleted.
+    """
+    previous = load_manifest(data_dir, manifest_dir)
+    manifest = {}
+    added, changed = [], []
+    for mouse in mice:
+        try:
+            manifest[mouse] = folder_manifest(data_dir, mouse, previous.get(mouse))
+        except OSError as e:
+            print(f"Could not scan {mouse}: {e}")
+            manifest[mouse] = None
+        if mouse not in previous:
+            added.append(mouse)
+        elif _file_hashes(manifest[mouse]) != _file_hashes(previous[mouse]):
+            changed.append(mouse)
+    removed = [mouse for mouse in previous if mouse not in manifest]
+    return manifest, added, changed, removed
+
+
+def _run_pool(fn, jobs, max_workers=None):
+    """
+    Run fn(mouse, job) for every mouse in parallel worker processes and yield (mouse, result, error)
+    as they finish, error being None on success. A failing mouse (or a crashed worker) does not stop
+    the others.
+
+    Args:
+        fn (callable): Worker process entry point, a module-level function so that it can be pickled.
+        jobs (dict): Mouse -> job passed to fn.
+        max_workers (int): Number of worker processes. Defaults to the number of CPUs;
+            with 1 the jobs run one after another in this process.
+    """
+    max_workers = min(max_workers or os.cpu_count() or 1, len(jobs))
+    if max_workers <= 1:
+        for mouse, job in jobs.items():
+            try:
+                result, error = fn(mouse, job), None
+            except Exception as e:
+                result, error = None, e
+            yield mouse, result, error
+        return
+
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        futures = {executor.submit(fn, mouse, job): mouse for mouse, job in jobs.items()}
+        for future in as_completed(futures):
+            try:
+                result, error = future.result(), None
+            except Exception as e:
+                result, error = None, e
+            yield futures[future], result, error
+
+
+def _load_session_bytes(mouse, job):
+    """
+    Worker process entry point: load a session into the on-disk cache. The session itself is only
+    sent back, in its compact binary form, when it could not be cached.
+    """
+    merged = load_session(mouse, **job)
+    return None if merged.source else merged.to_bytes()
+
+
+def load_sessions(jobs, max_workers=None):
+    """
+    Load the sessions of several mice, processing the uncached ones in parallel worker processes.
+
+    Args:
+        jobs (dict): Mouse -> load_session keyword arguments (see session_job).
+        max_workers (int): Number of worker processes. Defaults to the number of CPUs;
+            with 1 the sessions are processed one after another in this process.
+
+    Returns:
+        sessions (dict): Mouse -> MergeDatasets. Mice that failed to load are reported and left out.
+    """
+    sessions = {}
+    pending = {}
+    for mouse, job in jobs.items():
+        try:
+            merged = load_session(mouse, cached_only=True, **job)
+        except OSError as e:
+            print(f"Could not load {mouse}: {e}")
+            continue
+        if merged is not None:
+            sessions[mouse] = merged
+        else:
+            pending[mouse] = job
+
+    for mouse, data, error in _run_pool(_load_session_bytes, pending, max_workers):
+        try:
+            if error is not None:
+                raise error
+            if data is None:
+                # the worker stored the session in the on-disk cache, read it from there so that
+                # it is memory-mapped and shared with the other pages
+                merged = load_session(mouse, cached_only=True, **pending[mouse])
+                if merged is None:
+                    raise OSError("session is missing from the cache")
+            else:
+                merged = MergeDatasets.from_bytes(data)
+        except Exception as e:
+            print(f"Could not load {mouse}: {e}")
+            continue
+        sessions[mouse] = merged
+        print('Loaded data', mouse)
+    return sessions
+
+
+def _cache_session(mouse, job):
+    """
+    Worker process entry point: process a session into the on-disk cache without sending it back.
+    """
+    load_session(mouse, **job)
+
+
+def process_sessions(jobs, max_workers=None, progress=None):
+    """
+    Process the sessions of several mice into the on-disk cache, in parallel worker processes.
+    Pages then only read the finished sessions from the cache.
+
+    Args:
+        jobs (dict): Mouse -> load_session keyword arguments (see session_job).
+        max_workers (int): Number of worker processes. Defaults to the number of CPUs.
+        progress (callable): Called as progress(mouse, done, total, eta) after each mouse,
+            eta being the estimated number of seconds left.
+
+    Returns:
+        finished (list): Mice whose sessions are cached.
+        failed (dict): Mouse -> error message of the mice that could not be processed.
+    """
+    finished = []
+    failed = {}
+    total = len(jobs)
+    start = time.time()
+
+    def report(mouse):
+        done = len(finished) + len(failed)
+        eta = (time.time() - start) / done * (total - done)
+        print(f"Processed {mouse} ({done}/{total}, {eta:.0f} s left)")
+        if progress:
+            progress(mouse, done, total, eta)
+
+    pending = {}
+    for mouse, job in jobs.items():
+        try:
+            cached = load_session(mouse, cached_only=True, **job)
+        except OSError as e:
+            failed[mouse] = str(e)
+            report(mouse)
+            continue
+        if cached is not None:
+            finished.append(mouse)
+            report(mouse)
+        else:
+            pending[mouse] = job
+
+    for mouse, _, error in _run_pool(_cache_session, pending, max_workers):
+        if error is None:
+            finished.append(mouse)
+        else:
+            failed[mouse] = str(error)
+        report(mouse)
+    return finished, failed
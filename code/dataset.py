@@ -1,11 +1,106 @@
 import pandas as pd
 import numpy as np
 import matplotlib.pyplot as plt
-from scipy.ndimage import convolve1d
-from scipy.signal import butter, filtfilt
+from scipy.ndimage import convolve1d, correlate1d, uniform_filter1d
+from scipy.signal import butter, fftconvolve, iirnotch, sosfiltfilt, tf2sos
 from scipy.interpolate import interp1d
 import sys
 import os
+import json
+import base64
+import time
+
+try:
+    import pyarrow  # optional, multi-threaded CSV parser
+    CSV_ENGINE = 'pyarrow'
+except ImportError:
+    CSV_ENGINE = 'c'
+
+# Tapered smoothing windows of PhotometryDataset.smooth_signals
+WINDOWS = {'hanning': np.hanning, 'hamming': np.hamming, 'bartlett': np.bartlett, 'blackman': np.blackman}
+
+# DeepLabCut body part -> column prefix used by BehaviorDataset
+BODY_PARTS = {'head': 'head', 'middle tail': 'tail', 'base tail': 'base'}
+
+
+def _report_ingest(file_path, rows, seconds, engine):
+    """
+    Print the read throughput of a CSV file and return it as a dict.
+    """
+    stats = {'rows': rows, 'seconds': seconds, 'rows_per_s': rows / seconds if seconds > 0 else float('inf'),
+             'engine': engine}
+    print(f"Read {rows} rows from {os.path.basename(file_path)} in {seconds:.3f}s "
+          f"({stats['rows_per_s']:.0f} rows/s, {engine} engine)")
+    return stats
+
+
+def read_photometry_csv(file_path, column_map, ttl_col='DI/O-1', time_col='Time(s)',
+                        signal_dtype=np.float64, engine=None):
+    """
+    Read only the time, TTL and mapped signal columns of a photometry recording with fixed dtypes.
+
+    Args:
+        file_path (str): Path to the photometry data file.
+        column_map (dict): Recorded column name -> signal name. Only these signals are read.
+        ttl_col (str): Column name for TTL signal.
+        time_col (str): Column name for the timestamps.
+        signal_dtype: dtype of the signal columns.
+        engine (str): pandas CSV engine, defaults to pyarrow when it is installed.
+
+    Returns:
+        df (pd.DataFrame): Columns renamed through column_map.
+        stats (dict): Rows read, seconds and rows/s.
+    """
+    engine = engine or CSV_ENGINE
+    dtype = {time_col: np.float64, ttl_col: np.float32}
+    dtype.update({col: signal_dtype for col in column_map})
+
+    start = time.perf_counter()
+    df = pd.read_csv(file_path, usecols=list(dtype), dtype=dtype, engine=engine)
+    stats = _report_ingest(file_path, len(df), time.perf_counter() - start, engine)
+    return df.rename(columns=column_map), stats
+
+
+def read_behavior_csv(file_path, body_parts=BODY_PARTS, dtype=np.float64, engine=None):
+    """
+    Read the x/y positions of the tracked body parts from a DeepLabCut CSV.
+
+    The three header rows (scorer, bodyparts, coords) are parsed by hand so that only the needed
+    columns are read, already as numbers. Likelihoods and other body parts are skipped.
+
+    Args:
+        file_path (str): Path to the behavior data file.
+        body_parts (dict): DeepLabCut body part -> column prefix, giving '<prefix>_x' and '<prefix>_y'.
+        dtype: dtype of the position columns.
+        engine (str): pandas CSV engine, defaults to pyarrow when it is installed.
+
+    Returns:
+        df (pd.DataFrame): One '<prefix>_x' and '<prefix>_y' column per body part.
+        stats (dict): Rows read, seconds and rows/s.
+    """
+    engine = engine or CSV_ENGINE
+    with open(file_path) as f:
+        f.readline()  # scorer
+        parts = f.readline().rstrip('\r\n').split(',')
+        coords = f.readline().rstrip('\r\n').split(',')
+
+    usecols, names = [], []
+    for part, prefix in body_parts.items():
+        for coord in ('x', 'y'):
+            matches = [i for i, (p, c) in enumerate(zip(parts, coords)) if p == part and c == coord]
+            if not matches:
+                raise ValueError(f"Body part '{part}' ({coord}) not found in {file_path}")
+            usecols.append(matches[0])
+            names.append(f'{prefix}_{coord}')
+
+    # the columns come back in file order, labelled by position (c) or from 0 (pyarrow),
+    # so label them by rank with the names sorted along with the positions
+    file_order = sorted(zip(usecols, names))
+    start = time.perf_counter()
+    df = pd.read_csv(file_path, header=None, skiprows=3, usecols=[i for i, _ in file_order], dtype=dtype, engine=engine)
+    stats = _report_ingest(file_path, len(df), time.perf_counter() - start, engine)
+    return df.set_axis([name for _, name in file_order], axis=1)[names], stats
+
 
 class PhotometryDataset():
     """
@@ -17,9 +112,17 @@ class PhotometryDataset():
             The control (405nm) should be named ".control" and the signal (465nm) should be named ".signal"
         ttl_col (str): Column name for TTL signal
         bin_size (float): Size of the time bins for data binning in seconds
-        cutoff (float): Cutoff frequency for low-pass filter
+        cutoff (float): Cutoff frequency of the filter in Hz, a (low, high) pair for a band-pass filter
         fps (int): Sampling frequency of the data in Hz
+        engine (str): pandas CSV engine, defaults to pyarrow when it is installed
+        filter_type (str): Butterworth filter type, 'low', 'high' or 'band'
+        filter_order (int): Order of the Butterworth filter
+        notch (float): Frequency in Hz removed by an additional notch filter (e.g. 50 or 60 Hz line noise), None for no notch
+        notch_q (float): Quality factor of the notch filter
     """
+    # Tapered smoothing windows of at least this many samples are applied with an FFT
+    FFT_WINDOW = 64
+
     def __init__(self,
                  file_path,
                  column_map={"channel1_410": "ACC.control",
@@ -29,9 +132,14 @@ class PhotometryDataset():
                  ttl_col='DI/O-1',
                  bin_size=0.01,
                  cutoff=1.7,
-                 fps=100):
+                 fps=100,
+                 engine=None,
+                 filter_type='low',
+                 filter_order=2,
+                 notch=None,
+                 notch_q=30):
         
-        self.df = pd.read_csv(file_path).rename(columns=column_map)
+        self.df, self.ingest_stats = read_photometry_csv(file_path, column_map, ttl_col=ttl_col, engine=engine)
         self.df = self.df.dropna()  # this will shift the time
         self.column_map = column_map
         self.ttl_col = ttl_col
@@ -39,37 +147,67 @@ class PhotometryDataset():
         self.bin_size = bin_size
         self.cutoff = cutoff
         self.fps = fps
+        self.filter_type = filter_type
+        self.filter_order = filter_order
+        self.notch = notch
+        self.notch_q = notch_q
+        self.sos = self.design_filter()
 
         self.df = self.bin_data(self.df, column_map, bin_size=self.bin_size)
         print(self.df.head())
 
-        # Apply low-pass filter to each signal
-        for col in column_map.values():
-            self.df[col] = self.low_pass_filter(self.df[col])
+        # Filter all channels at once
+        self.filter_signals(list(column_map.values()))
 
     def bin_data(self, df, column_map, bin_size=0.01):
         """
         Bin data at specified time interval.
+
+        Each sample goes to the bin with index round(time / bin_size); the signals are averaged
+        and the TTL takes its minimum within a bin. Empty bins are left out.
         """
-        agg = {self.ttl_col: 'min'}  # aggregate using mean
+        time = df["Time(s)"].to_numpy(dtype=np.float64)
+        index = np.rint(time * (1 / bin_size)).astype(np.int64)
+        order = np.argsort(index, kind='stable') if np.any(np.diff(index) < 0) else slice(None)
+        index = index[order]
+
+        # first sample of every bin
+        starts = np.flatnonzero(np.r_[True, index[1:] != index[:-1]])
+        counts = np.diff(np.r_[starts, len(index)])
+
+        binned = {"Time(s)": np.round(index[starts] * bin_size, 10)}
+        binned[self.ttl_col] = np.minimum.reduceat(df[self.ttl_col].to_numpy()[order], starts)
         for col in column_map.values():
-            agg[col] = "mean"
+            binned[col] = np.add.reduceat(df[col].to_numpy(dtype=np.float64)[order], starts) / counts
 
-        df["Time_bin"] = df["Time(s)"].round(2)  # Create a new column for binning
-        df_binned = df.groupby("Time_bin").agg(agg).reset_index()
-        df_binned.rename(columns={"Time_bin": "Time(s)"}, inplace=True)  # Rename back
+        return pd.DataFrame(binned)
 
-        return df_binned
+    def design_filter(self):
+        """
+        Design the Butterworth filter (and the optional notch filter) from the instance parameters
+        as second-order sections, which stay numerically stable for low cutoffs and high orders.
+        """
+        sos = butter(self.filter_order, self.cutoff, btype=self.filter_type, fs=self.fps, output='sos')
+        if self.notch:
+            b, a = iirnotch(self.notch, self.notch_q, fs=self.fps)
+            sos = np.vstack([sos, tf2sos(b, a)])
+        return sos
 
-    def low_pass_filter(self, data, cutoff=1.7, fs=100):
+    def filter_signals(self, columns):
         """
-        Apply low-pass filter to data using Butterworth filter.
+        Filter the given columns forward and backward (zero phase) with the filter designed once
+        by design_filter. The columns are filtered one at a time, so no 2D copy of all channels is built.
         """
-        nyquist = 0.5 * fs
-        norm_cutoff = cutoff / nyquist
-        b, a = butter(2, norm_cutoff, btype='low', analog=False)
+        for col in columns:
+            self.df[col] = sosfiltfilt(self.sos, self.df[col].to_numpy(dtype=np.float64))
 
-        return filtfilt(b, a, data) 
+    def low_pass_filter(self, data, cutoff=None, fs=None):
+        """
+        Apply low-pass filter to data using Butterworth filter.
+        The cutoff and sampling frequency default to the ones of the instance.
+        """
+        sos = butter(self.filter_order, cutoff or self.cutoff, btype='low', fs=fs or self.fps, output='sos')
+        return sosfiltfilt(sos, np.asarray(data, dtype=np.float64), axis=0)
     
     def smooth_signal(self, x, window_len=10, window='flat'):
         """
@@ -80,25 +218,47 @@ class PhotometryDataset():
         in the beginning and end part of the output signal.
         (Code adapted from https://scipy-cookbook.readthedocs.io/items/SignalSmooth.html)
         """
-        if x.ndim != 1:
-            raise(ValueError, "smooth only accepts 1 dimension arrays.")
-        if x.size < window_len:
-            raise(ValueError, "Input vector needs to be bigger than window size.")
+        if np.ndim(x) != 1:
+            raise ValueError("smooth only accepts 1 dimension arrays.")
+        return self.smooth_signals(x, window_len=window_len, window=window)
+
+    def smooth_signals(self, data, window_len=10, window='flat'):
+        """
+        Smooth every column of a 2D array (or a 1D array) like smooth_signal, all channels at once.
+
+        Flat windows are applied as a running mean (uniform_filter1d), so their cost does not grow
+        with the window length. Tapered windows are convolved directly when they are short and
+        with an FFT from FFT_WINDOW samples on, where it becomes cheaper.
+        """
+        x = np.asarray(data, dtype=np.float64)
+        if x.shape[0] < window_len:
+            raise ValueError("Input vector needs to be bigger than window size.")
         if window_len < 3:
             return x
-
-        if not window in ['flat', 'hanning', 'hamming', 'bartlett', 'blackman']:
-            raise(ValueError, "Window is one of 'flat', 'hanning', 'hamming', 'bartlett', 'blackman'")
-        
-        s = np.r_[x[window_len-1:0:-1], x, x[-2:-window_len-1:-1]]
+        if window != 'flat' and window not in WINDOWS:
+            raise ValueError("Window is one of 'flat', 'hanning', 'hamming', 'bartlett', 'blackman'")
+
+        # one contiguous row per channel, with window_len - 1 samples reflected (without the
+        # edge sample) at both ends
+        channels = np.ascontiguousarray(x.reshape(x.shape[0], -1).T)
+        s = np.pad(channels, [(0, 0), (window_len - 1, window_len - 1)], mode='reflect')
+        n_valid = s.shape[1] - window_len + 1
+        # a filter centered on i covers s[i - window_len // 2:][:window_len], keep the ones inside s
+        centered = slice(window_len // 2, window_len // 2 + n_valid)
         if window == 'flat':  # Moving average
-            w = np.ones(window_len, 'd')
+            y = uniform_filter1d(s, window_len, axis=-1)[:, centered]
         else:
-            w = eval('np.' + window + '(window_len)')
+            w = WINDOWS[window](window_len)
+            w = w / w.sum()
+            if window_len >= self.FFT_WINDOW:
+                y = fftconvolve(s, w[None, :], mode='valid', axes=-1)
+            else:
+                # the windows are symmetric, so correlating gives the convolution
+                y = correlate1d(s, w, axis=-1)[:, centered]
+
+        y = y[:, (int(window_len/2)-1):-int(window_len/2)].T
+        return y.reshape((y.shape[0],) + x.shape[1:])
 
-        y = np.convolve(w/w.sum(), s, mode='valid')
-        return y[(int(window_len/2)-1):-int(window_len/2)]
-    
     def linear_baseline(self, signal):
         x = np.arange(len(signal))  # Create x-values (indices of the signal)
         coeffs = np.polyfit(x, signal, deg=1)  # Fit a linear function (degree 1)
@@ -115,9 +275,13 @@ class PhotometryDataset():
         region = list(set([col.split(".")[0] for col in columns]))
         df_normalized = self.df.copy()
 
+        # smooth the signal and control of all regions at once
+        channels = [reg + suffix for reg in region for suffix in (".signal", ".control")]
+        smoothed = self.smooth_signals(self.df[channels].to_numpy(dtype=np.float64))
+
         for reg in region:
-            raw_signal = self.smooth_signal(self.df[reg + ".signal"])
-            raw_control = self.smooth_signal(self.df[reg + ".control"])
+            raw_signal = smoothed[:, channels.index(reg + ".signal")]
+            raw_control = smoothed[:, channels.index(reg + ".control")]
 
             # Compute linear baselines
             s_base = self.linear_baseline(raw_signal)
@@ -145,23 +309,21 @@ class BehaviorDataset():
     
     Args:
         file_path (str): Path to the behavior data file.
+        fps (int): Frame rate of the video in Hz.
+        body_parts (dict): DeepLabCut body part -> column prefix. Only these positions are read;
+            'head' and 'base' are used for the velocity.
+        engine (str): pandas CSV engine, defaults to pyarrow when it is installed.
     """
     def __init__(self,
                  file_path,
-                 fps=30):
+                 fps=30,
+                 body_parts=BODY_PARTS,
+                 engine=None):
         
-        dataframe = pd.read_csv(file_path, header=1)
-        dataframe = dataframe.drop(dataframe.index[0])
+        dataframe, self.ingest_stats = read_behavior_csv(file_path, body_parts=body_parts, engine=engine)
 
         self.fps = fps
 
-        dataframe['head_x'] = dataframe['head'].astype(float)
-        dataframe['head_y'] = dataframe['head.1'].astype(float)
-        dataframe['tail_x'] = dataframe['middle tail'].astype(float)
-        dataframe['tail_y'] = dataframe['middle tail.1'].astype(float)
-        dataframe['base_x'] = dataframe['base tail'].astype(float)
-        dataframe['base_y'] = dataframe['base tail.1'].astype(float)
-
         kernel = np.ones(60)
         base_convolved_x = convolve1d(dataframe['base_x'], kernel, mode='constant')
         base_convolved_y = convolve1d(dataframe['base_y'], kernel, mode='constant')
@@ -188,11 +350,28 @@ class BehaviorDataset():
     def detect_freezing(self, velocity, window_width=5, threshold=6):
         """
         Use mean velocity over window_width to detect freezing if below threshold.
+
+        The mean at frame i is taken over velocity[i - window_width//2:i + window_width//2]
+        (clipped to the recording) and computed for all frames at once from a cumulative sum.
+        Windows containing NaN never count as freezing.
         """
-        head_freezing = np.zeros(len(velocity))
-        for i in range(window_width, len(velocity)):
-            if velocity[max(i - (window_width//2), 0):min(i + (window_width//2), len(velocity))].mean() < threshold:
-                head_freezing[i] = 1
+        velocity = np.asarray(velocity, dtype=float)
+        n = len(velocity)
+        half = window_width // 2
+
+        missing = np.isnan(velocity)
+        csum = np.concatenate(([0.0], np.cumsum(np.where(missing, 0.0, velocity))))
+        cmissing = np.concatenate(([0], np.cumsum(missing)))
+
+        frames = np.arange(window_width, n)
+        lo = np.maximum(frames - half, 0)
+        hi = np.minimum(frames + half, n)
+        count = hi - lo
+        valid = (count > 0) & (cmissing[hi] - cmissing[lo] == 0)
+
+        head_freezing = np.zeros(n)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            head_freezing[frames] = valid & ((csum[hi] - csum[lo]) / count < threshold)
         kernel = np.ones(10)
         head_freezing = convolve1d(head_freezing, kernel, mode='constant')
         return head_freezing > 2
@@ -205,8 +384,20 @@ class MergeDatasets():
     Args:
         photometry (PhotometryDataset): Photometry dataset.
         behavior (BehaviorDataset): Behavior dataset.
+        events (list): Names of the event columns, defaults to ['freezing'].
+        fps (float): Rate of the merged clock in Hz, defaults to the lower of the two rates.
+        sync (str): How to align the behavior timeline to the DI/O-1 TTL of the photometry (see sync_time):
+            None keeps both recordings starting at t=0, 'offset' starts the video at the first rising
+            edge and 'warp' also stretches it so that its last frame falls on the last rising edge.
+
+    Both streams are resampled onto one clock with sample k at k / fps seconds, covering the time
+    recorded by both. Continuous columns are linearly interpolated; the TTL column and boolean or
+    integer columns (such as 'freezing') take the value of the nearest sample.
     """
-    def __init__(self, photometry, behavior, events=['freezing']):
+    # Marks buffers written by to_bytes
+    MAGIC = b'MMGDS1'
+
+    def __init__(self, photometry, behavior, events=None, fps=None, sync=None):
         # check that 'Time(s)' is in both dataframes with assert
         assert 'Time(s)' in photometry.df.columns, "Time(s) not in photometry dataframe"
         assert 'Time(s)' in behavior.df.columns, "Time(s) not in behavior dataframe"
@@ -214,41 +405,195 @@ class MergeDatasets():
         # check that DI/O-1 is in photometry dataframe
         assert 'DI/O-1' in photometry.df.columns, "DI/O-1 not in photometry dataframe"
 
-        # merge dataframes on 'Time(s)' and round to 2 decimal places
-        photometry.df['Time(s)'] = photometry.df['Time(s)'].round(2)
-        behavior.df['Time(s)'] = behavior.df['Time(s)'].round(2)
+        self.fps = fps or min(photometry.fps, behavior.fps)
+        self.events = list(events) if events is not None else ['freezing']
+        # intervals of the events added with add_event, by name
+        self.event_intervals = {}
+        # file the columns are memory-mapped from (see cache.read_session), None while they are in memory
+        self.source = None
+
+        photometry_time = photometry.df['Time(s)'].to_numpy(dtype=np.float64)
+        behavior_time = behavior.df['Time(s)'].to_numpy(dtype=np.float64)
+        if sync is not None:
+            behavior_time = self.sync_time(photometry_time, photometry.df['DI/O-1'].to_numpy(), behavior_time, sync)
+        first = max(photometry_time[0], behavior_time[0]) if len(photometry_time) and len(behavior_time) else 0
+        last = min(photometry_time[-1], behavior_time[-1]) if len(photometry_time) and len(behavior_time) else -1
+
+        # integer sample indices of the merged clock within the overlap of both recordings
+        index = np.arange(np.ceil(first * self.fps - 1e-9), np.floor(last * self.fps + 1e-9) + 1, dtype=np.int64)
+        time = index / self.fps
+
+        merged = {'Time(s)': np.round(time, 10)}
+        for dataset, source_time in ((photometry, photometry_time), (behavior, behavior_time)):
+            nearest = self.nearest_index(source_time, time)
+            for col in dataset.df.columns:
+                if col == 'Time(s)' or col in merged:
+                    continue
+                values = dataset.df[col].to_numpy()
+                if col == getattr(dataset, 'ttl_col', None) or values.dtype.kind in 'biu':
+                    merged[col] = values[nearest]
+                else:
+                    merged[col] = np.interp(time, source_time, values.astype(np.float64))
+        self.df = pd.DataFrame(merged)
+
+    @staticmethod
+    def find_edges(ttl, threshold=0.5):
+        """
+        Find the rising and falling edges of a TTL signal.
+
+        Returns:
+            rising (np.ndarray): Indices of the first sample above threshold of every pulse.
+            falling (np.ndarray): Indices of the first sample below threshold after every pulse.
+        """
+        high = np.asarray(ttl, dtype=np.float64) > threshold
+        change = np.flatnonzero(high[1:] != high[:-1]) + 1
+        rising = change[high[change]]
+        falling = change[~high[change]]
+        return rising, falling
+
+    @classmethod
+    def sync_time(cls, photometry_time, ttl, behavior_time, sync='offset'):
+        """
+        Map the behavior timeline onto the photometry clock using the TTL recorded with the photometry.
 
-        self.df = pd.merge(photometry.df, behavior.df, on="Time(s)", how="outer")
-        self.fps = min(photometry.fps, behavior.fps)
-        self.events = events
-        # drop rows with NaN values
-        self.df = self.df.dropna()
-        # Optionally filter out rows where DI/O-1 is 0 (currently commented out)
-        # self.df = self.df[self.df['DI/O-1'] != 0]
-        self.df = self.df.reset_index(drop=True)
+        'offset' shifts the behavior timeline so that its first frame falls on the first rising edge.
+        'warp' also scales it so that the last frame falls on the last rising edge. When there is one
+        rising edge per frame (a camera trigger), the edge times are used as the frame times directly.
 
-    def get_freezing_intervals(self, merge_range=1, event='freezing'):
+        Without any rising edge the behavior timeline is returned unchanged.
+        """
+        if sync not in ('offset', 'warp'):
+            raise ValueError(f"Unknown sync '{sync}', expected None, 'offset' or 'warp'")
+
+        rising, _ = cls.find_edges(ttl)
+        if not len(rising):
+            print("No TTL edge found, behavior is not synchronized")
+            return behavior_time
+        edges = photometry_time[rising]
+
+        if sync == 'offset' or len(rising) < 2:
+            offset = edges[0] - behavior_time[0]
+            print(f"Synchronized behavior: offset {offset:.3f}s")
+            return behavior_time + offset
+        if len(rising) == len(behavior_time):
+            print(f"Synchronized behavior: {len(rising)} frame triggers")
+            return edges
+        scale = (edges[-1] - edges[0]) / (behavior_time[-1] - behavior_time[0])
+        print(f"Synchronized behavior: offset {edges[0] - behavior_time[0]:.3f}s, scale {scale:.5f}")
+        return edges[0] + (behavior_time - behavior_time[0]) * scale
+
+    @staticmethod
+    def nearest_index(source_time, time):
         """
-        Get freezing intervals. Merge intervals that are within merge_range seconds of each other.
+        Index of the sample in source_time (sorted) closest to each entry of time.
         """
-        onsets = self.df[self.df[event].diff() == 1].index
-        offsets = self.df[self.df[event].diff() == -1].index
-        intervals = list(zip(onsets, offsets))
+        if len(source_time) < 2:
+            return np.zeros(len(time), dtype=np.int64)
+        right = np.clip(np.searchsorted(source_time, time), 1, len(source_time) - 1)
+        left = right - 1
+        return np.where(time - source_time[left] <= source_time[right] - time, left, right)
+
+    @staticmethod
+    def find_intervals(values, min_gap=0):
+        """
+        Find the bouts of a 0/1 event column.
 
-        # merge intervals that are within merge_range seconds of each other
-        merged = [intervals[0]]
-        threshold = merge_range * self.fps
+        Args:
+            values (array-like): Event column, any value > 0 counts as active.
+            min_gap (float): Bouts separated by fewer than min_gap samples are merged.
 
-        for start, end in intervals[1:]:
-            last_start, last_end = merged[-1]
-            # If the gap is less than threshold, merge the intervals
-            if start - last_end < threshold:
-                merged[-1] = (last_start, max(last_end, end))
-            else:
-                merged.append((start, end))
+        Returns:
+            onsets (np.ndarray): Index of the first sample of each bout.
+            offsets (np.ndarray): Index of the first sample after each bout. A bout that is still
+                active at the start of the recording has onset 0, one that is still active at the
+                end has offset len(values).
+        """
+        active = (np.asarray(values, dtype=float) > 0).astype(np.int8)
+        edges = np.diff(active, prepend=0, append=0)
+        onsets = np.flatnonzero(edges == 1)
+        offsets = np.flatnonzero(edges == -1)
+
+        if len(onsets) > 1:
+            # a gap is kept only if it is at least min_gap samples long
+            keep = onsets[1:] - offsets[:-1] >= min_gap
+            onsets = onsets[np.concatenate(([True], keep))]
+            offsets = offsets[np.concatenate((keep, [True]))]
+        return onsets, offsets
+
+    def get_event_intervals(self, merge_range=1, event='freezing'):
+        """
+        Get the onset and offset index arrays of an event. Merge intervals that are within
+        merge_range seconds of each other.
+        """
+        return self.find_intervals(self.df[event].to_numpy(), merge_range * self.fps)
 
-        return merged
+    def get_freezing_intervals(self, merge_range=1, event='freezing'):
+        """
+        Get freezing intervals as a list of (onset, offset) index pairs. Merge intervals that are
+        within merge_range seconds of each other.
+        """
+        onsets, offsets = self.get_event_intervals(merge_range, event)
+        return list(zip(onsets.tolist(), offsets.tolist()))
     
+    def _select_epochs(self, intervals, before=2, after=2, type='on', filter=True):
+        """
+        Select the epochs of a window around each event.
+
+        Returns:
+            starts (np.ndarray): Index of the first sample of each selected epoch.
+            intervals (np.ndarray): The (onset, offset) pairs of the selected epochs, shape (n_epochs, 2).
+            frames_before (int): Number of samples before the event.
+            frames_after (int): Number of samples after the event.
+        """
+        frames_before = int(before * self.fps)
+        frames_after = int(after * self.fps)
+        max = len(self.df) - 1
+
+        intervals = np.asarray(intervals, dtype=np.int64).reshape(-1, 2)
+        onsets, offsets = intervals[:, 0], intervals[:, 1]
+        if type == 'on':
+            anchors = onsets
+            min_duration = frames_after
+        elif type == 'off':
+            anchors = offsets
+            min_duration = frames_before
+        else:
+            raise ValueError(f"Type not recognized: {type}")
+
+        keep = np.ones(len(intervals), dtype=bool)
+        # filter out epochs where the event is shorter than the analysed part of the window
+        if filter:
+            keep &= offsets - onsets > min_duration
+        #filter out epochs that are out of bounds
+        keep &= (anchors - frames_before > 0) & (anchors + frames_after < max)
+
+        return anchors[keep] - frames_before, intervals[keep], frames_before, frames_after
+
+    def get_epoch_tensor(self, intervals, column, before=2, after=2, type='on', filter=True):
+        """
+        Get photometry data for all epochs of a region as one 2D array.
+
+        Args:
+            intervals (list): List of (onset, offset) index pairs.
+            column (str): Base name of the sensor (e.g. 'ACC' or 'ADN'). The method
+                          will use the corresponding column '{column}.zdFF'.
+            before (float): Seconds before the event to include.
+            after (float): Seconds after the event to include.
+            type (str): 'on' to use the onset of the interval, 'off' to use the offset.
+            filter (bool): Drop events shorter than the analysed part of the window.
+
+        Returns:
+            epochs (np.ndarray): Array of shape (n_epochs, n_samples) with
+                n_samples = int(before * fps) + int(after * fps).
+            times (np.ndarray): Time of each sample relative to the event, in seconds.
+            intervals (np.ndarray): The (onset, offset) pairs of the epochs, shape (n_epochs, 2).
+        """
+        starts, intervals, frames_before, frames_after = self._select_epochs(intervals, before, after, type, filter)
+        offsets = np.arange(frames_before + frames_after)
+        epochs = self.df[column + '.zdFF'].to_numpy()[starts[:, None] + offsets]
+        times = (offsets - frames_before) / self.fps
+        return epochs, times, intervals
+
     def get_epoch_data(self, intervals, column, before=2, after=2, type='on', filter=True):
         """
         Get photometry data for each epoch defined by a window around an event.
@@ -267,85 +612,176 @@ class MergeDatasets():
                 - Tuple (on, off): the original event interval.
                 - The sensor data (as a pandas Series) for the epoch.
         """
-        frames_before = int(before * self.fps)
-        frames_after = int(after * self.fps)
-        max = self.df.index[-1]
-
-        # filter out epochs where the difference between their onsets is less than twice the epoch duration
-        if type == 'on':
-            diff = np.diff([on for on, off in intervals])
-        elif type == 'off':
-            diff = np.diff([off for on, off in intervals])
-        else:
-            # throw an error
-            print("Type not recognized")
-
-        diff = np.insert(diff, 0, 0)
-
-        if filter:
-            if type == 'on':
-                epochs = [((int(on-frames_before), int(on+frames_after)), intervals[i]) for i,(on, off) in enumerate(intervals)  if off - on > frames_after]
-            elif type == 'off':
-                epochs = [((int(off-frames_before), int(off+frames_after)), intervals[i]) for i,(on, off) in enumerate(intervals)  if off - on > frames_before]
-            else:
-                # throw an error
-                print("Type not recognized")
-        else:
-            if type == 'on':
-                epochs = [((int(on-frames_before), int(on+frames_after)), intervals[i]) for i,(on, off) in enumerate(intervals)]
-            elif type == 'off':
-                epochs = [((int(off-frames_before), int(off+frames_after)), intervals[i]) for i,(on, off) in enumerate(intervals)]
-            else:
-                # throw an error
-                print("Type not recognized")
-
-        #filter out epochs that are out of bounds
-        epochs = [((beg, end), inter) for (beg, end), inter in epochs if beg > 0 and end < max]
-        epochs = [[(beg, end), inter, self.df[column+'.zdFF'][beg:end]] for (beg, end), inter in epochs]
-        
-        return epochs
+        starts, intervals, frames_before, frames_after = self._select_epochs(intervals, before, after, type, filter)
+        length = frames_before + frames_after
+        return [[(beg, beg + length), (on, off), self.df[column + '.zdFF'][beg:beg + length]]
+                for beg, (on, off) in zip(starts.tolist(), intervals.tolist())]
     
     def get_epoch_average(self, intervals, column, before=2, after=2, type='on', filter=True):
         """
         Get the average signal before and after each event.
-        """
-
-        epochs = self.get_epoch_data(intervals, column, before, after, type, filter)
-
-        epoch_avg = []
-        for epoch in epochs:
-            signal = epoch[2]
-            before_frames = int(before * self.fps)
 
-            before_signal = signal[:before_frames]
-            after_signal = signal[before_frames:]
-
-            epoch_avg.append([before_signal.mean(), after_signal.mean(), after_signal.mean() - before_signal.mean()])
+        Returns:
+            epoch_avg (list): One [mean before, mean after, mean after - mean before] entry per epoch.
+        """
+        epochs, times, _ = self.get_epoch_tensor(intervals, column, before, after, type, filter)
+        before_frames = int(before * self.fps)
 
-        return epoch_avg
+        before_mean = epochs[:, :before_frames].mean(axis=1)
+        after_mean = epochs[:, before_frames:].mean(axis=1)
+        return np.column_stack((before_mean, after_mean, after_mean - before_mean)).tolist()
     
     def add_event(self, name, intervals):
         """
         Add an event to the dataset.
-         - intervals are in seconds
+         - intervals are in seconds, given as {'start': ..., 'end': ...} dictionaries
+         - rows with start <= Time(s) <= end are set to 1
+
+        Each interval is mapped to a row range with a binary search on the time column and the
+        column is filled from a difference array, so the cost does not grow with rows x intervals.
+        Malformed intervals (missing or non-numeric bounds, end before start) are reported and skipped.
         """
-        self.df[name] = 0
+        starts, ends = [], []
+        for i, interval in enumerate(intervals or []):
+            try:
+                start, end = float(interval['start']), float(interval['end'])
+            except (TypeError, KeyError, ValueError):
+                print(f"Skipping malformed interval {i} of event '{name}': {interval}")
+                continue
+            if not (np.isfinite(start) and np.isfinite(end)) or end < start:
+                print(f"Skipping malformed interval {i} of event '{name}': {interval}")
+                continue
+            starts.append(start)
+            ends.append(end)
+
+        time = self.df['Time(s)'].to_numpy(dtype=np.float64)
+        order = None
+        if np.any(np.diff(time) < 0):
+            order = np.argsort(time, kind='stable')
+            time = time[order]
+
+        n = len(time)
+        first = np.searchsorted(time, starts, side='left')  # first row with Time(s) >= start
+        stop = np.searchsorted(time, ends, side='right')    # first row with Time(s) > end
+        active = np.cumsum(np.bincount(first, minlength=n + 1) - np.bincount(stop, minlength=n + 1))[:n] > 0
+        if order is not None:
+            active[order] = active.copy()
+
+        self.df[name] = active.astype(np.int64)
         if name not in self.events:
             self.events.append(name)
-        try:
-            for interval in intervals:
-                start = interval['start']
-                end = interval['end']
-                self.df.loc[(self.df['Time(s)'] >= start) & (self.df['Time(s)'] <= end), name] = 1
-        except:
-            pass
+        self.event_intervals[name] = list(intervals or [])
     
+    def remove_event(self, name):
+        """
+        Remove an event added with add_event.
+        """
+        self.df = self.df.drop(columns=name, errors='ignore')
+        if name in self.events:
+            self.events.remove(name)
+        self.event_intervals.pop(name, None)
+
+    def apply_events(self, events):
+        """
+        Bring the added events in line with an event-store dictionary (name -> intervals): new and
+        changed events are (re)added and events that are no longer listed are removed. Unchanged
+        event columns are kept as they are.
+
+        Returns:
+            changed (list): Names of the events that were added, updated or removed.
+        """
+        changed = []
+        for name in list(self.event_intervals):
+            if name not in events:
+                self.remove_event(name)
+                changed.append(name)
+        for name, intervals in events.items():
+            if self.event_intervals.get(name) != list(intervals) or name not in self.df.columns:
+                self.add_event(name, intervals)
+                changed.append(name)
+        return changed
+
+    def copy(self):
+        """
+        Return a shallow copy: the columns are shared, but adding or removing events on the copy
+        does not affect this dataset.
+        """
+        instance = self.__class__.__new__(self.__class__)
+        instance.df = self.df.copy(deep=False)
+        instance.fps = self.fps
+        instance.events = list(self.events)
+        instance.event_intervals = dict(self.event_intervals)
+        instance.source = self.source
+        return instance
+
+    def to_bytes(self):
+        """
+        Encode the merged dataset as a single binary buffer.
+
+        The buffer starts with a JSON header (fps, events, event intervals and the schema of every column: name,
+        dtype, offset and length) followed by the raw column arrays, each aligned to 64 bytes.
+        Object columns are stored as floats when possible and as fixed-width strings otherwise.
+        """
+        columns = []
+        arrays = []
+        offset = 0
+        for col in self.df.columns:
+            values = self.df[col].to_numpy()
+            if values.dtype == object:
+                try:
+                    values = values.astype(float)
+                except (TypeError, ValueError):
+                    values = values.astype(str)
+            values = np.ascontiguousarray(values)
+            columns.append({'name': col, 'dtype': values.dtype.str, 'offset': offset, 'length': len(values)})
+            arrays.append(values)
+            offset += -(-values.nbytes // 64) * 64
+
+        header = json.dumps({'fps': self.fps, 'events': list(self.events), 'event_intervals': self.event_intervals,
+                             'columns': columns}).encode()
+        start = -(-(len(self.MAGIC) + 8 + len(header)) // 64) * 64
+        buffer = np.zeros(start + offset, dtype=np.uint8)
+        prefix = self.MAGIC + len(header).to_bytes(8, 'little') + header
+        buffer[:len(prefix)] = np.frombuffer(prefix, dtype=np.uint8)
+        for column, values in zip(columns, arrays):
+            begin = start + column['offset']
+            buffer[begin:begin + values.nbytes] = values.reshape(-1).view(np.uint8)
+        return buffer.tobytes()
+
+    @classmethod
+    def from_bytes(cls, buffer):
+        """
+        Create a MergeDatasets instance from a buffer written by to_bytes.
+
+        The columns are read-only views into the buffer, so decoding does not copy any data.
+        The buffer can also be a memory-mapped file.
+        """
+        buffer = memoryview(buffer).cast('B')
+        if bytes(buffer[:len(cls.MAGIC)]) != cls.MAGIC:
+            raise ValueError("Buffer is not an encoded MergeDatasets")
+        size = int.from_bytes(buffer[len(cls.MAGIC):len(cls.MAGIC) + 8], 'little')
+        header = json.loads(bytes(buffer[len(cls.MAGIC) + 8:len(cls.MAGIC) + 8 + size]))
+        start = -(-(len(cls.MAGIC) + 8 + size) // 64) * 64
+
+        data = {}
+        for column in header['columns']:
+            data[column['name']] = np.frombuffer(buffer, dtype=np.dtype(column['dtype']),
+                                                 count=column['length'], offset=start + column['offset'])
+
+        instance = cls.__new__(cls)
+        instance.df = pd.DataFrame(data, copy=False)
+        instance.fps = header['fps']
+        instance.events = header['events']
+        instance.event_intervals = header.get('event_intervals', {})
+        instance.source = None
+        return instance
+
     def to_dict(self):
         """
-        Convert the merged dataset to a dictionary format.
+        Convert the merged dataset to a JSON-serializable dictionary (the to_bytes buffer in base64).
         """
         return {
-            'df': self.df.to_dict(),
+            'data': base64.b64encode(self.to_bytes()).decode('ascii'),
             'fps': self.fps,
             'events': self.events
         }
@@ -355,9 +791,15 @@ class MergeDatasets():
         """
         Create a MergeDatasets instance from a dictionary.
         """
+        if 'data' in data_dict:
+            return cls.from_bytes(base64.b64decode(data_dict['data']))
+
+        # dictionaries written before the binary encoding hold the dataframe itself
         instance = cls.__new__(cls)
         instance.df = pd.DataFrame.from_dict(data_dict['df'])
         instance.events = data_dict['events']
+        instance.event_intervals = {}
+        instance.source = None
         for event in data_dict['events']:
             instance.df[event] = instance.df[event].astype(int)
         # make index to integer
@@ -373,3 +815,59 @@ class MergeDatasets():
         instance.fps = data_dict['fps']
         return instance
 
+
+class EpochEngine():
+    """
+    Class for extracting the epochs of all regions and both alignments in one pass.
+
+    The zdFF columns of all regions are stacked once, and for each alignment the epoch windows
+    are selected once and gathered for every region with a single indexing operation.
+
+    Args:
+        merged (MergeDatasets): Merged dataset.
+        before (float): Seconds before the event to include.
+        after (float): Seconds after the event to include.
+        filter (bool): Drop events shorter than the analysed part of the window.
+        regions (list): Regions to extract (e.g. ['ACC', 'ADN']). Defaults to every region with a zdFF column.
+    """
+    def __init__(self, merged, before=2, after=2, filter=True, regions=None):
+        self.merged = merged
+        self.before = before
+        self.after = after
+        self.filter = filter
+        if regions is None:
+            regions = [col[:-len('.zdFF')] for col in merged.df.columns if col.endswith('.zdFF')]
+        self.regions = list(regions)
+        # shape (n_rows, n_regions)
+        self.signals = np.column_stack([merged.df[reg + '.zdFF'].to_numpy() for reg in self.regions])
+
+    def run(self, intervals):
+        """
+        Extract the epochs around the given intervals.
+
+        Args:
+            intervals (list): List of (onset, offset) index pairs.
+
+        Returns:
+            results (dict): For each region, a dict with:
+                - 'on' / 'off': (epochs, times, intervals) tuples as returned by MergeDatasets.get_epoch_tensor.
+                - 'avg_on' / 'avg_off': Arrays of shape (n_epochs, 3) holding the mean before the event,
+                  the mean after the event and their difference (see MergeDatasets.get_epoch_average).
+        """
+        results = {reg: {} for reg in self.regions}
+        for type in ['on', 'off']:
+            starts, selected, frames_before, frames_after = self.merged._select_epochs(
+                intervals, self.before, self.after, type, self.filter)
+            offsets = np.arange(frames_before + frames_after)
+            times = (offsets - frames_before) / self.merged.fps
+
+            # shape (n_epochs, n_samples, n_regions)
+            epochs = self.signals[starts[:, None] + offsets]
+            before_mean = epochs[:, :frames_before].mean(axis=1)
+            after_mean = epochs[:, frames_before:].mean(axis=1)
+
+            for i, reg in enumerate(self.regions):
+                results[reg][type] = (epochs[:, :, i], times, selected)
+                results[reg]['avg_' + type] = np.column_stack((before_mean[:, i], after_mean[:, i],
+                                                               after_mean[:, i] - before_mean[:, i]))
+        return results
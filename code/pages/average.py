@@ -2,16 +2,16 @@ import os
 import sys
 import dash
 import dash_daq as daq
-import numpy as np
-import pandas as pd
 from dash import dcc, html, callback
 from dash.dependencies import Input, Output, State
-from code.dataset import PhotometryDataset, BehaviorDataset, MergeDatasets
+from code.dataset import EpochEngine
+from code.cache import load_sessions, session_job, LOAD_WORKERS, SYNC
+from code.store import session_store
 from dash_local_react_components import load_react_component
 from dash import callback_context
 
 # Import visualization functions
-from code.visualize import generate_average_plot, generate_plots
+from code.visualize import generate_average_plot
 # Import utility for condition assignments mapping (e.g., {'mouse1': 1, 'mouse2': 3, ...})
 from code.utils import load_assignments
 
@@ -30,34 +30,6 @@ if getattr(sys, 'frozen', False):
 else:
     base_path = os.path.dirname(os.path.abspath(__file__))
 
-def load_raw_data(data_dir, mouse, events):
-    """Load raw merged data for all mice and store in mouse_data."""
-    mouse_data = {}
-    photometry_path = os.path.join(data_dir, mouse, f"{mouse.split('_')[0]}_recording.csv.csv")
-    behavior_path = os.path.join(data_dir, mouse, f"{mouse.split('_')[0]}_behavior.csv.csv")
-    print('Loading data', mouse)
-    if os.path.exists(photometry_path) and os.path.exists(behavior_path):
-        photometry = PhotometryDataset(
-            photometry_path,
-            column_map={
-                "channel1_410": "ACC.control",
-                "channel1_470": "ACC.signal",
-                "channel2_410": "ADN.control",
-                "channel2_470": "ADN.signal"
-            }
-        )
-        behavior = BehaviorDataset(behavior_path)
-        photometry.normalize_signal()
-        merged = MergeDatasets(photometry, behavior)
-        if events:
-            # Ensure events are added only once
-            added_events = set()
-            for name, intervals in events.items():
-                if name not in added_events:
-                    merged.add_event(name, intervals)
-                    added_events.add(name)
-        return merged.to_dict()
-
 # Load condition assignments mapping: mouse id -> condition group
 condition_assignments = load_assignments()
 
@@ -202,32 +174,55 @@ def populate_group_dropdown_options(
     Output('mouse-data-store', 'data'),
     [Input('selected-folder', 'data'), 
      Input('event-store', 'data'),
-     Input('app-state', 'data')],
+     Input('app-state', 'data'),
+     Input('session-id', 'data'),
+     Input('processed-store', 'data')],
      [State('mouse-data-store', 'data')]
 )
 
-def load_mouse_data(folder, events, app_state, data):
+def load_mouse_data(folder, events, app_state, session_id, processed, data):
 
     if not data:
         data = {}
 
     # Ensure app_state is not None
-    if not app_state:
+    if not app_state or not session_id:
         return data
     # Ensure the callback only runs for the `/mouse/<id>` path
     mouse_data = app_state.get('mouse_data', {})
 
+    # Sessions are processed by the background job of the home page, only read the finished ones
+    processed = processed or {}
+    finished = set(processed.get('finished', [])) if processed.get('folder') == folder else set()
+    # When a job has just finished, reload the mice whose files were added or changed
+    rescanned = set(processed.get('updated', [])) if callback_context.triggered_id == 'processed-store' else set()
+
+    # Drop the mice whose folder was deleted
+    data = {mouse: handle for mouse, handle in data.items() if mouse in mouse_data}
+
+    # data only holds handles, the datasets themselves stay in the server-side session store
+    jobs = {}
     for mouse in mouse_data:
-        # Check if data[mouse] is None or if events do not match
-        if mouse not in data.keys() or not data[mouse]: #or events != data[mouse].get('events', None):
-            mouse_data = load_raw_data(folder, mouse, events)
-            data[mouse] = mouse_data
-        elif events and events != [] and events != {}:
-            ctx = callback_context
-            mouse_data = load_raw_data(folder, mouse, events)
-            data[mouse] = mouse_data
-        else:
-            pass
+        merged = None if mouse in rescanned else session_store.get(data.get(mouse))
+        # Reload the dataset only if it is missing (e.g. after a server restart)
+        if merged is None:
+            if mouse in finished:
+                jobs[mouse] = session_job(folder, mouse, sync=SYNC)
+            data[mouse] = None
+            continue
+        # Otherwise only add, update or remove the event columns that changed, on a copy so that
+        # figures being rendered from the current version are not affected
+        updated = merged.copy()
+        if updated.apply_events(events or {}):
+            data[mouse] = session_store.put(session_id, mouse, updated)
+
+    # Load all mice at once, spread over worker processes
+    sessions = load_sessions({mouse: job for mouse, job in jobs.items() if job is not None}, max_workers=LOAD_WORKERS)
+    for mouse, merged in sessions.items():
+        # loaded sessions are shared between pages, add the events to a copy
+        merged = merged.copy()
+        merged.apply_events(events or {})
+        data[mouse] = session_store.put(session_id, mouse, merged)
     return data
 
 
@@ -330,8 +325,8 @@ def update_graph(mouse_data,
         if merged is None or mouse not in assignments:
             continue
         mouse_group = assignments.get(mouse)
-        merged = MergeDatasets.from_dict(merged)
-        if mouse_group not in selected_groups:
+        merged = session_store.get(merged)
+        if merged is None or mouse_group not in selected_groups:
             continue
 
         # Precompute intervals and epochs
@@ -340,26 +335,20 @@ def update_graph(mouse_data,
 
         if fps is None:
             fps = merged.fps
-        acc_epochs_on = merged.get_epoch_data(intervals, 'ACC', before=seconds_before, after=seconds_after, type='on', filter=on)
-        acc_epochs_off = merged.get_epoch_data(intervals, 'ACC', before=seconds_before, after=seconds_after, type='off', filter=on)
-        adn_epochs_on = merged.get_epoch_data(intervals, 'ADN', before=seconds_before, after=seconds_after, type='on', filter=on)
-        adn_epochs_off = merged.get_epoch_data(intervals, 'ADN', before=seconds_before, after=seconds_after, type='off', filter=on)
-
-        acc_avg_on = merged.get_epoch_average(intervals, 'ACC', before=seconds_before, after=seconds_after, filter=on)
-        adn_avg_on = merged.get_epoch_average(intervals, 'ADN', before=seconds_before, after=seconds_after, filter=on)
-        acc_avg_off = merged.get_epoch_average(intervals, 'ACC', before=seconds_before, after=seconds_after, type='off', filter=on)
-        adn_avg_off = merged.get_epoch_average(intervals, 'ADN', before=seconds_before, after=seconds_after, type='off', filter=on)
+        # Extract the epochs and averages of both regions and alignments in one pass
+        epochs = EpochEngine(merged, before=seconds_before, after=seconds_after, filter=on, regions=['ACC', 'ADN']).run(intervals)
         
-        # Append epochs to the proper group in the dictionaries.
-        acc_on_dict.setdefault(mouse_group, []).extend([epoch[2] for epoch in acc_epochs_on])
-        acc_off_dict.setdefault(mouse_group, []).extend([epoch[2] for epoch in acc_epochs_off])
-        adn_on_dict.setdefault(mouse_group, []).extend([epoch[2] for epoch in adn_epochs_on])
-        adn_off_dict.setdefault(mouse_group, []).extend([epoch[2] for epoch in adn_epochs_off])
-
-        acc_avg_on_dict.setdefault(mouse_group, []).extend([epoch[2] for epoch in acc_avg_on])
-        adn_avg_on_dict.setdefault(mouse_group, []).extend([epoch[2] for epoch in adn_avg_on])
-        acc_avg_off_dict.setdefault(mouse_group, []).extend([epoch[2] for epoch in acc_avg_off])
-        adn_avg_off_dict.setdefault(mouse_group, []).extend([epoch[2] for epoch in adn_avg_off])
+        # Append epochs (rows of the epoch tensors) to the proper group in the dictionaries.
+        acc_on_dict.setdefault(mouse_group, []).extend(epochs['ACC']['on'][0])
+        acc_off_dict.setdefault(mouse_group, []).extend(epochs['ACC']['off'][0])
+        adn_on_dict.setdefault(mouse_group, []).extend(epochs['ADN']['on'][0])
+        adn_off_dict.setdefault(mouse_group, []).extend(epochs['ADN']['off'][0])
+
+        # Append the change (after - before) of each epoch.
+        acc_avg_on_dict.setdefault(mouse_group, []).extend(epochs['ACC']['avg_on'][:, 2])
+        adn_avg_on_dict.setdefault(mouse_group, []).extend(epochs['ADN']['avg_on'][:, 2])
+        acc_avg_off_dict.setdefault(mouse_group, []).extend(epochs['ACC']['avg_off'][:, 2])
+        adn_avg_off_dict.setdefault(mouse_group, []).extend(epochs['ADN']['avg_off'][:, 2])
     
     # If no data was collected, show a message.
     if fps is None:
@@ -1,13 +1,28 @@
+import os
 import dash
 from dash import html, dcc
 from dash.dependencies import Input, Output, State
 import dash_table
 from dash_local_react_components import load_react_component
 import dash_daq as daq
+from code.cache import is_cached, process_sessions, session_job, scan_folder, save_manifest, LOAD_WORKERS, SYNC
+
+# diskcache is optional: without it the folder is processed within the request, without progress
+try:
+    import diskcache
+    from dash import DiskcacheManager
+except ImportError:
+    diskcache = None
 
 dash.register_page(__name__, path='/')
 app = dash.get_app()
 
+# Folder holding the progress and results of the processing jobs
+JOBS_DIR = os.path.join(os.path.expanduser('~'), '.mousememorygraph', 'jobs')
+
+# Processing jobs run in a separate process, so the server keeps answering while mice are processed
+background_manager = DiskcacheManager(diskcache.Cache(JOBS_DIR)) if diskcache else None
+
 # Load the EventSelection React component globally
 EventSelection = load_react_component(app, "components", "EventSelection.js")
 
@@ -78,6 +93,31 @@ layout = html.Div([
         'margin': '10px 0',
         'backgroundColor': 'white'
     }),
+    html.Div([
+        html.Progress(id='process-progress', value='0', max='1', style={'width': '80%', 'marginRight': '10px'}),
+        html.Button(
+            'Cancel',
+            id='cancel-process',
+            n_clicks=0,
+            disabled=True,
+            style={
+                'height': '40px',
+                'lineHeight': '40px',
+                'borderWidth': '1px',
+                'borderStyle': 'solid',
+                'borderRadius': '10px',
+                'padding': '0 20px'
+            }
+        ),
+        html.Div(id='process-status'),
+        html.Div(id='process-summary')
+    ], style={
+        'backgroundColor': 'white',
+        'borderRadius': '10px',
+        'padding': '10px',
+        'margin': '10px 0',
+        'textAlign': 'center'
+    }),
     dcc.Loading(
         type="circle",
         children=[
@@ -311,4 +351,85 @@ def populate_event_selection_options(hidden_event_store, event_store, selected_e
 def update_selected_folder(n_clicks, input, selected_folder):
     if input == selected_folder:
         return dash.no_update
-    return input
\ No newline at end of file
+    return input
+
+def process_folder(set_progress, app_state):
+    """
+    Process the mice of the submitted folder into the session cache, reporting the progress
+    after each mouse. The pages only read the finished sessions listed in the processed-store.
+
+    The folder is compared with the manifest of its last scan: only new or changed mice are
+    processed. Unchanged mice are marked finished from the manifest, without hashing or reading
+    their files again, as long as their session is still in the cache.
+    """
+    folder = (app_state or {}).get('folder')
+    if not folder:
+        return dash.no_update, dash.no_update
+
+    manifest, added, changed, removed = scan_folder(folder, app_state.get('mouse_data', {}))
+    print(f"Scanned {folder}: {len(added)} new, {len(changed)} changed, {len(removed)} removed mice")
+
+    jobs = {}
+    failed = {}
+    unchanged = []
+    for mouse, entry in manifest.items():
+        if entry is None:
+            failed[mouse] = 'recording or behavior file missing'
+            continue
+        job = session_job(folder, mouse, sync=SYNC)
+        # unchanged mice are reprocessed only if their session left the cache (e.g. new parameters)
+        if mouse in added or mouse in changed or not is_cached(**job):
+            jobs[mouse] = job
+        else:
+            unchanged.append(mouse)
+
+    def progress(mouse, done, total, eta):
+        if set_progress:
+            set_progress((str(done), str(total), f"Processed {mouse} ({done}/{total}), about {eta:.0f} s left"))
+
+    if set_progress and not jobs:
+        # nothing to process, show a full bar instead of leaving it at 0
+        set_progress(('1', '1', "Nothing to process, all mice are up to date."))
+    elif set_progress:
+        set_progress(('0', str(len(jobs)),
+                      f"Processing {len(jobs)} mice ({len(added)} new, {len(changed)} changed)..."))
+    finished, errors = process_sessions(jobs, max_workers=LOAD_WORKERS, progress=progress)
+    finished += unchanged
+    failed.update(errors)
+    # failed mice are left out of the manifest, so they are retried by the next scan
+    save_manifest(folder, {mouse: manifest[mouse] for mouse in finished})
+
+    summary = [html.P(f"{len(finished)} of {len(manifest)} mice processed "
+                      f"({len(added)} new, {len(changed)} changed, {len(removed)} removed).")]
+    summary += [html.P(f"Could not process {mouse}: {error}") for mouse, error in sorted(failed.items())]
+    processed = {'folder': folder, 'finished': sorted(finished), 'failed': failed,
+                 'updated': sorted(added + changed), 'removed': removed}
+    return processed, summary
+
+# The Process button submits a background job, the Cancel button stops it
+process_outputs = [Output('processed-store', 'data'), Output('process-summary', 'children')]
+process_running = [(Output('submit-path', 'disabled'), True, False),
+                   (Output('cancel-process', 'disabled'), False, True)]
+
+if background_manager is not None:
+    app.callback(
+        process_outputs,
+        Input('app-state', 'data'),
+        background=True,
+        manager=background_manager,
+        progress=[Output('process-progress', 'value'),
+                  Output('process-progress', 'max'),
+                  Output('process-status', 'children')],
+        cancel=[Input('cancel-process', 'n_clicks')],
+        running=process_running,
+        prevent_initial_call=True
+    )(process_folder)
+else:
+    @app.callback(
+        process_outputs,
+        Input('app-state', 'data'),
+        running=process_running,
+        prevent_initial_call=True
+    )
+    def process_folder_in_request(app_state):
+        return process_folder(None, app_state)
@@ -1,22 +1,18 @@
 import os
 import sys
-import time
-import webbrowser
 import dash
 import dash_daq as daq
-import numpy as np
-import pandas as pd
 import plotly.graph_objs as go
-from dash import dcc, html, callback
-from dash.dependencies import Input, Output, State
-from code.dataset import PhotometryDataset, BehaviorDataset, MergeDatasets
+from dash import dcc, html, callback, Patch, no_update
+from dash.dependencies import Input, Output, State, ClientsideFunction
+from code.dataset import EpochEngine
+from code.store import session_store
 from dash_local_react_components import load_react_component
 
 # Import visualization functions (from your separate file)
-from code.visualize import generate_plots, generate_separated_plot
+from code.visualize import generate_plots, generate_separated_plot, signal_window, figure_nbytes
+from code.memo import LRUCache
 
-from code.utils import load_assignments, save_assignments
-from functools import lru_cache
 from concurrent.futures import ThreadPoolExecutor
 
 dash.register_page(__name__, path_template='/mouse/<id>')
@@ -29,42 +25,13 @@ else:
     base_path = os.path.dirname(os.path.abspath(__file__))
 
 
+# Rendered figures of recently viewed mice and analysis parameters (MMG_FIGURE_CACHE_MB limits their size)
+figure_cache = LRUCache(max_items=64, max_bytes=int(os.environ.get('MMG_FIGURE_CACHE_MB', 256)) << 20)
+
 # Load the GroupDropdown React component globally
 GroupDropdown = load_react_component(app, "components", "GroupDropdown.js")
 EventRender = load_react_component(app, "components", "EventRender.js")
 
-# Cache for data loading
-@lru_cache(maxsize=10)
-def load_raw_data(
-    data_dir, 
-    mouse, 
-    events=None
-    ):
-    """Load raw merged data for a specific mouse and cache the result."""
-    # Convert events dictionary to a hashable type (tuple of sorted key-value pairs)
-    events = tuple(sorted(events.items())) if events else None
-
-    photometry_path = os.path.join(data_dir, mouse, f"{mouse}_recording.csv")
-    behavior_path = os.path.join(data_dir, mouse, f"{mouse}_behavior.csv")
-    if os.path.exists(photometry_path) and os.path.exists(behavior_path):
-        photometry = PhotometryDataset(
-            photometry_path,
-            column_map={
-                "channel1_410": "ACC.control",
-                "channel1_470": "ACC.signal",
-                "channel2_410": "ADN.control",
-                "channel2_470": "ADN.signal"
-            }
-        )
-        behavior = BehaviorDataset(behavior_path)
-        photometry.normalize_signal()
-        merged = MergeDatasets(photometry, behavior)
-        if events:
-            for name, intervals in dict(events).items():  # Convert back to dict for processing
-                merged.add_event(name, intervals)
-        return merged.to_dict()
-    return None
-
 def layout(
         id=None, 
         **other_unknown_query_strings
@@ -83,6 +50,20 @@ def layout(
                 daq.BooleanSwitch(id='boolean-switch', on=True, color='lightblue'),
                 html.Div(id='boolean-switch-output')
             ], style={'display': 'flex', 'align-items': 'center', 'margin-bottom': '10px'}),
+            html.Div([
+                html.Label("Rendering:"),
+                dcc.RadioItems(
+                    id='render-mode',
+                    options=[
+                        {'label': 'Auto', 'value': 'auto'},
+                        {'label': 'SVG', 'value': 'svg'},
+                        {'label': 'WebGL', 'value': 'webgl'},
+                    ],
+                    value='auto',
+                    inline=True,
+                    style={'margin-left': '10px'}
+                ),
+            ], style={'display': 'flex', 'align-items': 'center', 'margin-bottom': '10px'}),
             html.Div([EventRender(id='event-selection-mouse', value='freezing')], style={'margin-bottom': '10px'}),
             html.Div([
                 html.Label("Seconds Before Event:"),
@@ -206,6 +187,53 @@ def populate_group_dropdown_options(
     return [{'label': key['group'], 'value': key['group'], 'text': key['group'], 'color': key['color']} for key in options]
 
 
+def build_figures(merged, seconds_before, seconds_after, on, selected_event, event_colors, render_mode):
+    """
+    Build the ten figures of the mouse page:
+    ACC full, interval on, interval off, change, separated, then the same for ADN.
+    """
+    mergeddataset = merged.df
+    fps = merged.fps
+    
+    # Precompute intervals and epochs
+    intervals = merged.get_freezing_intervals() if selected_event == 'freezing' else merged.get_freezing_intervals(0, selected_event)
+    freezing_intervals = merged.get_freezing_intervals()
+    # Extract the epochs and averages of both regions and alignments in one pass
+    epoch_data = EpochEngine(merged, before=seconds_before, after=seconds_after, filter=on, regions=['ACC', 'ADN']).run(intervals)
+
+    # Use ThreadPoolExecutor for parallel figure generation
+    with ThreadPoolExecutor() as executor:
+        acc_future = executor.submit(generate_plots, merged, merged.df, freezing_intervals, fps, seconds_before, seconds_after,
+                                     epoch_data['ACC']['on'], epoch_data['ACC']['off'],
+                                     epoch_data['ACC']['avg_on'],
+                                     epoch_data['ACC']['avg_off'],
+                                     selected_event,
+                                     event_colors,
+                                     name='ACC',
+                                     render_mode=render_mode)
+        adn_future = executor.submit(generate_plots, merged, merged.df, freezing_intervals, fps, seconds_before, seconds_after,
+                                     epoch_data['ADN']['on'], epoch_data['ADN']['off'],
+                                     epoch_data['ADN']['avg_on'],
+                                     epoch_data['ADN']['avg_off'],
+                                     selected_event,
+                                     event_colors,
+                                     name='ADN',
+                                     render_mode=render_mode)
+
+        acc_full, acc_interval_on, acc_interval_off, acc_change = acc_future.result()
+        adn_full, adn_interval_on, adn_interval_off, adn_change = adn_future.result()
+
+    acc_separated = generate_separated_plot(merged, 'ACC', 200, epoch_data['ACC']['on'],
+                                             mergeddataset, fps, freezing_intervals, seconds_after, selected_event, event_colors,
+                                             render_mode=render_mode)
+    adn_separated = generate_separated_plot(merged, 'ADN', 200, epoch_data['ADN']['on'],
+                                             mergeddataset, fps, freezing_intervals, seconds_after, selected_event, event_colors,
+                                             render_mode=render_mode)
+
+    return (acc_full, acc_interval_on, acc_interval_off, acc_change, acc_separated,
+            adn_full, adn_interval_on, adn_interval_off, adn_change, adn_separated)
+
+
 @callback(
     Output('mouse-content', 'children'),
     [Input('mouse-data-store', 'data'),
@@ -218,7 +246,8 @@ def populate_group_dropdown_options(
      Input('y-axis-step', 'value'),
      Input('graph-title', 'value'),
      Input('x-axis-title', 'value'),
-     Input('y-axis-title', 'value')],
+     Input('y-axis-title', 'value'),
+     Input('render-mode', 'value')],
      [State('event-colors', 'data')]
 )
 
@@ -234,6 +263,7 @@ def update_graph(
      graph_title,
      x_axis_title,
      y_axis_title,
+     render_mode,
      event_colors
     ):
 
@@ -241,51 +271,24 @@ def update_graph(
     if not mouse_data:
             return "No data available."
     mouse = pathname.split('/')[-1]
-    mouse_data = mouse_data[mouse]
-    merged = MergeDatasets.from_dict(mouse_data)
-    mergeddataset = merged.df
-    fps = merged.fps
-    
-    # Precompute intervals and epochs
-    intervals = merged.get_freezing_intervals() if selected_event == 'freezing' else merged.get_freezing_intervals(0, selected_event)
-    freezing_intervals = merged.get_freezing_intervals()
-    epoch_data = {
-        'ACC': {
-            'on': merged.get_epoch_data(intervals, 'ACC', before=seconds_before, after=seconds_after, filter=on),
-            'off': merged.get_epoch_data(intervals, 'ACC', before=seconds_before, after=seconds_after, type='off', filter=on)
-        },
-        'ADN': {
-            'on': merged.get_epoch_data(intervals, 'ADN', before=seconds_before, after=seconds_after, filter=on),
-            'off': merged.get_epoch_data(intervals, 'ADN', before=seconds_before, after=seconds_after, type='off', filter=on)
-        }
-    }
-
-    # Use ThreadPoolExecutor for parallel figure generation
-    with ThreadPoolExecutor() as executor:
-        acc_future = executor.submit(generate_plots, merged, merged.df, freezing_intervals, fps, seconds_before, seconds_after,
-                                     epoch_data['ACC']['on'], epoch_data['ACC']['off'],
-                                     merged.get_epoch_average(intervals, 'ACC', before=seconds_before, after=seconds_after, filter=on),
-                                     merged.get_epoch_average(intervals, 'ACC', before=seconds_before, after=seconds_after, type='off', filter=on),
-                                     selected_event,
-                                     event_colors,
-                                     name='ACC')
-        adn_future = executor.submit(generate_plots, merged, merged.df, freezing_intervals, fps, seconds_before, seconds_after,
-                                     epoch_data['ADN']['on'], epoch_data['ADN']['off'],
-                                     merged.get_epoch_average(intervals, 'ADN', before=seconds_before, after=seconds_after, filter=on),
-                                     merged.get_epoch_average(intervals, 'ADN', before=seconds_before, after=seconds_after, type='off', filter=on),
-                                     selected_event,
-                                     event_colors,
-                                     name='ADN')
-
-        acc_full, acc_interval_on, acc_interval_off, acc_change = acc_future.result()
-        adn_full, adn_interval_on, adn_interval_off, adn_change = adn_future.result()
-
-    acc_separated = generate_separated_plot(merged, 'ACC', 200,
-                                             merged.get_epoch_data(intervals, 'ACC', before=seconds_before, after=seconds_after, filter=on),
-                                             mergeddataset, fps, freezing_intervals, seconds_after, selected_event, event_colors)
-    adn_separated = generate_separated_plot(merged, 'ADN', 200,
-                                             merged.get_epoch_data(intervals, 'ADN', before=seconds_before, after=seconds_after, filter=on),
-                                             mergeddataset, fps, freezing_intervals, seconds_after, selected_event, event_colors)
+    merged = session_store.get(mouse_data.get(mouse))
+    if merged is None:
+        return "No data available."
+
+    # Figures only depend on the session version and the analysis parameters, so views that were
+    # already rendered (e.g. switching back to another event) are taken from the figure cache
+    key = (mouse, mouse_data[mouse]['version'], selected_event, seconds_before, seconds_after, bool(on),
+           render_mode, tuple(sorted((event_colors or {}).items())))
+    figures = figure_cache.get(key)
+    if figures is None:
+        figures = build_figures(merged, seconds_before, seconds_after, on, selected_event, event_colors, render_mode)
+        figure_cache.put(key, figures, nbytes=figure_nbytes(figures))
+
+    # The cached figures are shared, so customize copies of them
+    if x_axis_step or y_axis_step or graph_title or x_axis_title or y_axis_title:
+        figures = tuple(go.Figure(fig) for fig in figures)
+    (acc_full, acc_interval_on, acc_interval_off, acc_change, acc_separated,
+     adn_full, adn_interval_on, adn_interval_off, adn_change, adn_separated) = figures
 
     # Update axis steps and layout titles for all figures (not x axis for bar plots)
     figure_list = [
@@ -306,7 +309,7 @@ def update_graph(
         if x_axis_title:
             fig.update_layout(xaxis_title=x_axis_title)
         if y_axis_title:    
-            fig.update_layout(yaxis_title=y_axis_title)
+            fig.update_yaxes(title_text=y_axis_title)
     
     
     content = html.Div([
@@ -415,6 +418,62 @@ def update_graph(
     
     return content
 
+
+def relayout_range(relayout_data):
+    """
+    Return the new x range of a relayoutData event, 'auto' when the axis was reset,
+    or None when the x axis did not change.
+    """
+    if not relayout_data:
+        return None
+    if 'xaxis.range[0]' in relayout_data and 'xaxis.range[1]' in relayout_data:
+        return [relayout_data['xaxis.range[0]'], relayout_data['xaxis.range[1]']]
+    if 'xaxis.range' in relayout_data:
+        return relayout_data['xaxis.range']
+    if relayout_data.get('xaxis.autorange'):
+        return 'auto'
+    return None
+
+def zoom_signals(relayout_data, mouse_data, pathname, name):
+    """
+    Replace the signal, control and zdFF traces (traces 0-2) of a full signal figure with the data
+    of the visible window, at full resolution once the window is small enough.
+    """
+    x_range = relayout_range(relayout_data)
+    if x_range is None or not mouse_data:
+        return no_update
+    merged = session_store.get(mouse_data.get(pathname.split('/')[-1]))
+    if merged is None:
+        return no_update
+
+    window = signal_window(merged.df, [f'{name}.signal', f'{name}.control', f'{name}.zdFF'],
+                           x_range=None if x_range == 'auto' else x_range)
+    patched = Patch()
+    for i, (x, y) in enumerate(window):
+        patched['data'][i]['x'] = x
+        patched['data'][i]['y'] = y
+    return patched
+
+@callback(
+    Output('acc', 'figure', allow_duplicate=True),
+    Input('acc', 'relayoutData'),
+    [State('mouse-data-store', 'data'),
+     State('url', 'pathname')],
+    prevent_initial_call=True
+)
+def zoom_acc(relayout_data, mouse_data, pathname):
+    return zoom_signals(relayout_data, mouse_data, pathname, 'ACC')
+
+@callback(
+    Output('adn', 'figure', allow_duplicate=True),
+    Input('adn', 'relayoutData'),
+    [State('mouse-data-store', 'data'),
+     State('url', 'pathname')],
+    prevent_initial_call=True
+)
+def zoom_adn(relayout_data, mouse_data, pathname):
+    return zoom_signals(relayout_data, mouse_data, pathname, 'ADN')
+
 # Combined callback for handling both dropdown changes and URL updates.
 @app.callback(
     Output('group-dropdown', 'value'),
@@ -450,288 +509,22 @@ def update_mouse_assignment(mouse_assignments, new_value, color, pathname):
 
     return mouse_assignments
 
-@app.callback(
-    Output('acc-trace-dropdown', 'options'),
-    [
-        Input('acc-graph-dropdown', 'value'),
-        Input('acc', 'figure'),
-        Input('accintervalon', 'figure'),
-        Input('accintervaloff', 'figure'),
-        Input('accchange', 'figure'),
-        Input('acc_separated', 'figure')
-    ]
-)
-def update_acc_trace_options(
-    selected_graph,
-    fig_full,
-    fig_interval_on,
-    fig_interval_off,
-    fig_change,
-    fig_separated
-):
-    """
-    Decide which figure to pull trace data from based on selected_graph.
-    Then create a list of options (label/value) from that figure's traces.
-    """
-    if selected_graph == 'full':
-        fig = fig_full
-    elif selected_graph == 'interval_on':
-        fig = fig_interval_on
-    elif selected_graph == 'interval_off':
-        fig = fig_interval_off
-    elif selected_graph == 'avg_change':
-        fig = fig_change
-    elif selected_graph == 'separated':
-        fig = fig_separated
-    else:
-        fig = fig_full
-
-    if not fig or 'data' not in fig:
-        return []
-
-    options = []
-    for i, trace in enumerate(fig['data']):
-        trace_name = trace.get('name', f"Trace {i+1}")
-        options.append({'label': trace_name, 'value': i})
-    return options
-
-
-@app.callback(
-    Output('adn-trace-dropdown', 'options'),
-    [
-        Input('adn-graph-dropdown', 'value'),
-        Input('adn', 'figure'),
-        Input('adnintervalon', 'figure'),
-        Input('adnintervaloff', 'figure'),
-        Input('adnchange', 'figure'),
-        Input('adn_separated', 'figure')
-    ]
-)
-def update_adn_trace_options(
-    selected_graph,
-    fig_full,
-    fig_interval_on,
-    fig_interval_off,
-    fig_change,
-    fig_separated
-):
-    shapes = None
-    if selected_graph == 'full':
-        fig = fig_full
-        shapes = fig.get('layout', {}).get('shapes', [])
-    elif selected_graph == 'interval_on':
-        fig = fig_interval_on
-    elif selected_graph == 'interval_off':
-        fig = fig_interval_off
-    elif selected_graph == 'avg_change':
-        fig = fig_change
-    elif selected_graph == 'separated':
-        fig = fig_separated
-    else:
-        fig = fig_full
-
-    if not fig or 'data' not in fig:
-        return []
-
-    options = []
-    for i, trace in enumerate(fig['data']):
-        trace_name = trace.get('name', f"Trace {i+1}")
-        options.append({'label': trace_name, 'value': i})
-    #if shapes:
-    #    # get all unique names for shapes
-    #    shape_names = set([shape.get('name', 'None') for shape in shapes])
-    #    for i, shape_name in enumerate(shape_names):
-    #        options.append({'label': f"{shape_name}", 'value': shape_name})
-
-    return options
-
-
-@app.callback(
-    [
-      Output('acc', 'figure'),
-      Output('accintervalon', 'figure'),
-      Output('accintervaloff', 'figure'),
-      Output('accchange', 'figure'),
-      Output('acc_separated', 'figure')
-    ],
-    [Input('acc-color-picker', 'value'),
-     Input('acc-graph-dropdown', 'value'),
-     Input('acc-trace-dropdown', 'value')],
-    [
-      State('acc', 'figure'),
-      State('accintervalon', 'figure'),
-      State('accintervaloff', 'figure'),
-      State('accchange', 'figure'),
-      State('acc_separated', 'figure')
-    ]
-)
-def update_acc_color(color_value, selected_graph, selected_trace,
-                     fig_full, fig_interval_on, fig_interval_off,
-                     fig_change, fig_separated):
-    if selected_trace is None or color_value is None:
-        return fig_full, fig_interval_on, fig_interval_off, fig_change, fig_separated
-
-    rgb = color_value.get('rgb', {})
-    r = rgb.get('r', 0)
-    g = rgb.get('g', 0)
-    b = rgb.get('b', 0)
-    a = rgb.get('a', 1)
-    new_color = f"rgba({r},{g},{b},{a})"
-
-    if selected_graph == 'full':
-        if fig_full and 'data' in fig_full and len(fig_full['data']) > selected_trace:
-            if 'line' in fig_full['data'][selected_trace]:
-                fig_full['data'][selected_trace]['line']['color'] = new_color
-            else:
-                fig_full['data'][selected_trace]['marker']['color'] = new_color
-        return fig_full, fig_interval_on, fig_interval_off, fig_change, fig_separated
-
-    elif selected_graph == 'interval_on':
-        if fig_interval_on and 'data' in fig_interval_on and len(fig_interval_on['data']) > selected_trace:
-            if 'line' in fig_interval_on['data'][selected_trace]:
-                fig_interval_on['data'][selected_trace]['line']['color'] = new_color
-            else:
-                fig_interval_on['data'][selected_trace]['marker']['color'] = new_color
-        return fig_full, fig_interval_on, fig_interval_off, fig_change, fig_separated
-
-    elif selected_graph == 'interval_off':
-        if fig_interval_off and 'data' in fig_interval_off and len(fig_interval_off['data']) > selected_trace:
-            if 'line' in fig_interval_off['data'][selected_trace]:
-                fig_interval_off['data'][selected_trace]['line']['color'] = new_color
-            else:
-                fig_interval_off['data'][selected_trace]['marker']['color'] = new_color
-        return fig_full, fig_interval_on, fig_interval_off, fig_change, fig_separated
-
-    elif selected_graph == 'avg_change':
-        if fig_change and 'data' in fig_change and len(fig_change['data']) > selected_trace:
-            trace = fig_change['data'][selected_trace]
-            if trace.get('type') == 'box':
-                # Update both the marker (dots) and line (box outline) colors
-                trace['marker']['color'] = new_color
-                trace['line']['color'] = new_color
-                # Set fillcolor to same hue but with a fixed alpha (e.g., 0.2)
-                import re
-                match = re.match(r"rgba\((\d+),(\d+),(\d+),([\d.]+)\)", new_color)
-                if match:
-                    r_val, g_val, b_val, alpha = match.groups()
-                    fillcolor = f"rgba({r_val},{g_val},{b_val},0.2)"
-                    trace['fillcolor'] = fillcolor
-                else:
-                    trace['fillcolor'] = new_color
-            elif trace.get('type') in ['bar']:
-                trace['marker']['color'] = new_color
-            elif 'line' in trace:
-                trace['line']['color'] = new_color
-            elif 'marker' in trace:
-                trace['marker']['color'] = new_color
-        return fig_full, fig_interval_on, fig_interval_off, fig_change, fig_separated
-
-    elif selected_graph == 'separated':
-        if fig_separated and 'data' in fig_separated and len(fig_separated['data']) > selected_trace:
-            trace = fig_separated['data'][selected_trace]
-            if 'line' in trace:
-                trace['line']['color'] = new_color
-            elif 'marker' in trace:
-                trace['marker']['color'] = new_color
-        return fig_full, fig_interval_on, fig_interval_off, fig_change, fig_separated
-
-    else:
-        return fig_full, fig_interval_on, fig_interval_off, fig_change, fig_separated
-
-
-@app.callback(
-    [
-      Output('adn', 'figure'),
-      Output('adnintervalon', 'figure'),
-      Output('adnintervaloff', 'figure'),
-      Output('adnchange', 'figure'),
-      Output('adn_separated', 'figure')
-    ],
-    [Input('adn-color-picker', 'value'),
-     Input('adn-graph-dropdown', 'value'),
-     Input('adn-trace-dropdown', 'value')],
-    [
-      State('adn', 'figure'),
-      State('adnintervalon', 'figure'),
-      State('adnintervaloff', 'figure'),
-      State('adnchange', 'figure'),
-      State('adn_separated', 'figure')
-    ]
-)
-def update_adn_color(color_value, selected_graph, selected_trace,
-                     fig_full, fig_interval_on, fig_interval_off,
-                     fig_change, fig_separated):
-    if selected_trace is None or color_value is None:
-        return fig_full, fig_interval_on, fig_interval_off, fig_change, fig_separated
-
-    rgb = color_value.get('rgb', {})
-    r = rgb.get('r', 0)
-    g = rgb.get('g', 0)
-    b = rgb.get('b', 0)
-    a = rgb.get('a', 1)
-    new_color = f"rgba({r},{g},{b},{a})"
-
-    if selected_graph == 'full':
-        if type(selected_trace) == str:
-            if fig_full and 'layout' in fig_full and 'shapes' in fig_full['layout']:
-                for shape in fig_full['layout']['shapes']:
-                    if shape.get('name') == selected_trace:
-                        shape['line']['color'] = new_color
-                        shape['fillcolor'] = new_color
-        else:
-            if fig_full and 'data' in fig_full and len(fig_full['data']) > selected_trace:
-                if 'line' in fig_full['data'][selected_trace]:
-                    fig_full['data'][selected_trace]['line']['color'] = new_color
-                else:
-                    fig_full['data'][selected_trace]['marker']['color'] = new_color
-        return fig_full, fig_interval_on, fig_interval_off, fig_change, fig_separated
-
-    elif selected_graph == 'interval_on':
-        if fig_interval_on and 'data' in fig_interval_on and len(fig_interval_on['data']) > selected_trace:
-            if 'line' in fig_interval_on['data'][selected_trace]:
-                fig_interval_on['data'][selected_trace]['line']['color'] = new_color
-            else:
-                fig_interval_on['data'][selected_trace]['marker']['color'] = new_color
-        return fig_full, fig_interval_on, fig_interval_off, fig_change, fig_separated
-
-    elif selected_graph == 'interval_off':
-        if fig_interval_off and 'data' in fig_interval_off and len(fig_interval_off['data']) > selected_trace:
-            if 'line' in fig_interval_off['data'][selected_trace]:
-                fig_interval_off['data'][selected_trace]['line']['color'] = new_color
-            else:
-                fig_interval_off['data'][selected_trace]['marker']['color'] = new_color
-        return fig_full, fig_interval_on, fig_interval_off, fig_change, fig_separated
-
-    elif selected_graph == 'avg_change':
-        if fig_change and 'data' in fig_change and len(fig_change['data']) > selected_trace:
-            trace = fig_change['data'][selected_trace]
-            if trace.get('type') == 'box':
-                trace['marker']['color'] = new_color
-                trace['line']['color'] = new_color
-                import re
-                match = re.match(r"rgba\((\d+),(\d+),(\d+),([\d.]+)\)", new_color)
-                if match:
-                    r_val, g_val, b_val, alpha = match.groups()
-                    fillcolor = f"rgba({r_val},{g_val},{b_val},0.2)"
-                    trace['fillcolor'] = fillcolor
-                else:
-                    trace['fillcolor'] = new_color
-            elif trace.get('type') in ['bar']:
-                trace['marker']['color'] = new_color
-            elif 'line' in trace:
-                trace['line']['color'] = new_color
-            elif 'marker' in trace:
-                trace['marker']['color'] = new_color
-        return fig_full, fig_interval_on, fig_interval_off, fig_change, fig_separated
-
-    elif selected_graph == 'separated':
-        if fig_separated and 'data' in fig_separated and len(fig_separated['data']) > selected_trace:
-            trace = fig_separated['data'][selected_trace]
-            if 'line' in trace:
-                trace['line']['color'] = new_color
-            elif 'marker' in trace:
-                trace['marker']['color'] = new_color
-        return fig_full, fig_interval_on, fig_interval_off, fig_change, fig_separated
-
-    else:
-        return fig_full, fig_interval_on, fig_interval_off, fig_change, fig_separated
\ No newline at end of file
+# Trace options and color changes run in the browser (assets/mouse_colors.js), so the figures
+# are not sent to the server and back for every edit.
+for region in ['acc', 'adn']:
+    figures = [f'{region}', f'{region}intervalon', f'{region}intervaloff', f'{region}change', f'{region}_separated']
+
+    app.clientside_callback(
+        ClientsideFunction(namespace='mouse', function_name='traceOptions'),
+        Output(f'{region}-trace-dropdown', 'options'),
+        [Input(f'{region}-graph-dropdown', 'value')] + [Input(fig, 'figure') for fig in figures]
+    )
+
+    app.clientside_callback(
+        ClientsideFunction(namespace='mouse', function_name='updateTraceColor'),
+        [Output(fig, 'figure') for fig in figures],
+        [Input(f'{region}-color-picker', 'value'),
+         Input(f'{region}-graph-dropdown', 'value'),
+         Input(f'{region}-trace-dropdown', 'value')],
+        [State(fig, 'figure') for fig in figures]
+    )
@@ -0,0 +1,157 @@
+import os
+import shutil
+import tempfile
+import time
+import uuid
+import pandas as pd
+from code.cache import write_session, read_session
+from code.memo import LRUCache
+
+# Define the folder holding the stored sessions, shared by all server processes
+SESSION_DIR = os.path.join(tempfile.gettempdir(), 'mousememorygraph', 'sessions')
+
+
+class SessionStore():
+    """
+    Server-side store of merged datasets, keyed by browser session and mouse.
+
+    The browser only keeps the small handle returned by put; the data itself stays on the server.
+    Datasets read from the session cache keep their columns in the cache file, each version only
+    writes its event columns and intervals to a small read-only file. All server processes (e.g.
+    all gunicorn workers) memory-map both files, so the operating system keeps a single copy of the
+    columns in memory however many processes serve the session.
+
+    Args:
+        session_dir (str): Folder of the stored datasets, shared by all server processes.
+        max_open (int): Number of memory-mapped datasets each process keeps open.
+        max_age (float): Seconds after which the datasets of an inactive browser session are removed.
+    """
+    def __init__(self, session_dir=SESSION_DIR, max_open=256, max_age=7 * 24 * 3600):
+        self.session_dir = session_dir
+        self.max_age = max_age
+        self._open = LRUCache(max_items=max_open)  # (session, mouse, version) -> (MergeDatasets, path)
+
+    def _path(self, session, mouse=None, version=None):
+        path = os.path.join(self.session_dir, session)
+        if mouse:
+            path = os.path.join(path, mouse)
+        return os.path.join(path, version + '.bin') if version else path
+
+    def put(self, session, mouse, merged):
+        """
+        Store the dataset of a mouse and return its handle. Older versions are dropped.
+        """
+        handle = {'session': session, 'mouse': mouse, 'version': uuid.uuid4().hex}
+        base = self._base(merged)
+        if base:
+            # the other columns are read back from the cache file, only store the events
+            handle['base'] = base
+            stored = merged.copy()
+            stored.df = merged.df[[name for name in merged.event_intervals if name in merged.df.columns]]
+        else:
+            stored = merged
+        mouse_dir = self._path(session, mouse)
+        path = self._path(session, mouse, handle['version'])
+        try:
+            os.makedirs(mouse_dir, exist_ok=True)
+            write_session(path, stored)
+            if not base:
+                # use the mapped file in this process as well, so it shares the pages with the others
+                merged = read_session(path)
+            os.utime(self._path(session))
+        except OSError as e:
+            # the dataset is then only available in this process
+            print(f"Could not store session {mouse}: {e}")
+            path = None
+        self._open.put((session, mouse, handle['version']), (merged, path))
+
+        # drop the older versions of the mouse
+        for entry in os.listdir(mouse_dir) if path else []:
+            if entry != handle['version'] + '.bin' and not entry.startswith('.tmp-'):
+                self._remove(os.path.join(mouse_dir, entry))
+        self._prune(session)
+        return handle
+
+    def get(self, handle):
+        """
+        Return the dataset of a handle, or None if it is unknown (e.g. after a newer version was
+        stored by another process, or after its session or cache file was removed).
+        """
+        if not handle:
+            return None
+        key = (handle['session'], handle['mouse'], handle['version'])
+        base = handle.get('base')
+        entry = self._open.get(key)
+        if entry is not None:
+            # a version removed by another process is no longer valid
+            merged, path = entry
+            valid = path is None or (os.path.exists(path) and (not base or os.path.exists(base)))
+            return merged if valid else None
+
+        path = self._path(*key)
+        if not os.path.exists(path) or (base and not os.path.exists(base)):
+            return None
+        try:
+            merged = read_session(path)
+            if base:
+                merged = self._combine(read_session(base), merged)
+        except (OSError, ValueError, KeyError) as e:
+            print(f"Ignoring broken session {path}: {e}")
+            return None
+        self._open.put(key, (merged, path))
+        return merged
+
+    def _base(self, merged):
+        """
+        Return the session cache file holding the columns of a dataset, or None if it has none.
+        Files of the store itself are not used, as older versions get removed.
+        """
+        source = getattr(merged, 'source', None)
+        if not source or os.path.abspath(source).startswith(os.path.join(os.path.abspath(self.session_dir), '')):
+            return None
+        return source
+
+    def _combine(self, base, events):
+        """
+        Return the dataset of the base columns with the event columns and intervals of a version.
+        Base event columns that are no longer listed in the version are left out.
+        """
+        columns = {col: base.df[col] for col in base.df.columns
+                   if col not in base.events or col in events.events}
+        columns.update({col: events.df[col] for col in events.df.columns})
+        merged = base.copy()
+        merged.df = pd.DataFrame(columns, copy=False)
+        merged.events = list(events.events)
+        merged.event_intervals = dict(events.event_intervals)
+        return merged
+
+    def _remove(self, path):
+        # files still mapped by another process cannot be removed on Windows, they are retried later
+        try:
+            if os.path.isdir(path):
+                shutil.rmtree(path)
+            else:
+                os.remove(path)
+        except OSError:
+            pass
+
+    def _prune(self, current):
+        """
+        Remove the datasets of browser sessions that were not written to for max_age seconds.
+        """
+        try:
+            sessions = os.listdir(self.session_dir)
+        except OSError:
+            return
+        now = time.time()
+        for session in sessions:
+            path = self._path(session)
+            try:
+                inactive = session != current and now - os.path.getmtime(path) > self.max_age
+            except OSError:
+                continue
+            if inactive:
+                self._remove(path)
+
+
+session_store = SessionStore()
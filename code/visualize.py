@@ -7,6 +7,135 @@ pastel_colors = [
     '#FFB3BA', '#FFDFBA', '#FFFFBA', '#BAFFC9', '#BAE1FF', '#D4BAFF', '#FFBAE1', '#BAFFD4'
 ]
 
+# Maximum number of points sent per full-session trace
+LOD_POINTS = 4000
+
+# Figures of more samples than this (over all their full-session traces) are rendered with WebGL
+# in the 'auto' render mode
+WEBGL_THRESHOLD = 20000
+
+def scatter_type(n_samples, render_mode='auto'):
+    """
+    Return the trace class for a full-session trace: go.Scattergl for render_mode 'webgl'
+    (or 'auto' above WEBGL_THRESHOLD samples), go.Scatter (SVG) otherwise.
+
+    n_samples is the number of samples the traces cover before decimation, i.e. it grows with the
+    length of the session. The decimated traces draw at most about LOD_POINTS points each.
+    """
+    if render_mode == 'webgl' or (render_mode == 'auto' and n_samples > WEBGL_THRESHOLD):
+        return go.Scattergl
+    return go.Scatter
+
+def minmax_indices(y, max_points=LOD_POINTS):
+    """
+    Indices of a min-max decimation of y: the samples are split into max_points // 2 buckets and the
+    minimum and maximum of every bucket are kept, so peaks stay visible at any zoom level.
+    All indices are returned when y has at most max_points samples.
+    """
+    y = np.asarray(y, dtype=float)
+    n = len(y)
+    if n <= max_points:
+        return np.arange(n)
+
+    buckets = max(max_points // 2, 1)
+    size = -(-n // buckets)
+    blocks = np.pad(y, (0, buckets * size - n), mode='edge').reshape(buckets, size)
+    offsets = np.arange(buckets) * size
+    missing = np.isnan(blocks)
+    if missing.any():
+        low = np.argmin(np.where(missing, np.inf, blocks), axis=1) + offsets
+        high = np.argmax(np.where(missing, -np.inf, blocks), axis=1) + offsets
+    else:
+        low = np.argmin(blocks, axis=1) + offsets
+        high = np.argmax(blocks, axis=1) + offsets
+
+    index = np.concatenate(([0], np.minimum(np.concatenate((low, high)), n - 1), [n - 1]))
+    return np.unique(index)
+
+def signal_window(mergeddataset, columns, x_range=None, max_points=LOD_POINTS):
+    """
+    Return the (x, y) arrays of each column for the time window x_range (in seconds, the whole
+    session if None), decimated to at most about max_points samples per column.
+
+    x is taken from the 'Time(s)' column, which does not start at 0 once the behavior is synchronized
+    to the TTL. The window includes the samples just outside x_range, so the lines reach the edges.
+    """
+    time = mergeddataset['Time(s)'].to_numpy()
+    n = len(time)
+    start, stop = 0, n
+    if x_range is not None:
+        start = max(int(np.searchsorted(time, min(x_range), side='right')) - 1, 0)
+        stop = max(min(int(np.searchsorted(time, max(x_range), side='left')) + 1, n), start)
+
+    x = time[start:stop]
+    window = []
+    for col in columns:
+        y = mergeddataset[col].to_numpy()[start:stop]
+        index = minmax_indices(y, max_points)
+        window.append((x[index], y[index]))
+    return window
+
+def sample_times(time, index, fps):
+    """
+    Return the time in seconds of sample indices. Index len(time), the end of a bout that lasts until
+    the end of the recording, falls one sample after the last one.
+    """
+    index = np.asarray(index, dtype=np.int64)
+    if not len(time):
+        return index / fps
+    last = len(time) - 1
+    return np.where(index <= last, time[np.clip(index, 0, last)], time[last] + (index - last) / fps)
+
+def figure_nbytes(figures):
+    """
+    Estimate the memory used by the x/y data of the traces of some figures.
+    """
+    total = 0
+    for fig in figures:
+        for trace in fig.data:
+            for values in (getattr(trace, 'x', None), getattr(trace, 'y', None)):
+                if values is not None:
+                    total += values.nbytes if isinstance(values, np.ndarray) else 8 * len(values)
+    return total
+
+def band_axes(fig, **signal_axis):
+    """
+    Set up the y axes of a full-session figure: the signal traces go on yaxis2 (configured with
+    signal_axis), laid over a hidden yaxis with a fixed [0, 1] range that holds the event bands
+    (see event_band).
+
+    Plotly draws the traces of an overlaying axis above the ones of the axis it overlays, so the bands
+    stay behind the signals while the signal traces keep the first trace indices. As the band axis
+    never zooms, the bands always cover the full plot height.
+    """
+    fig.update_layout(yaxis=dict(range=[0, 1], fixedrange=True, visible=False),
+                      yaxis2=dict(overlaying='y', side='left', **signal_axis))
+
+def event_band(intervals, time, fps, color, name, opacity=0.3, legendgroup=None):
+    """
+    Shade event intervals with a single filled trace instead of one layout shape per interval.
+
+    Each (onset, offset) interval, in samples, becomes a rectangle placed at the times of its samples in
+    time (the 'Time(s)' column) and spanning the [0, 1] band axis of the figure (see band_axes). The
+    rectangles are separated by NaN so that fill='toself' closes each of them on its own.
+    """
+    bounds = sample_times(time, np.asarray(intervals, dtype=np.int64).reshape(-1, 2), fps)
+    on, off = bounds[:, 0], bounds[:, 1]
+    gap = np.full(len(bounds), np.nan)
+    return go.Scatter(
+        x=np.column_stack([on, on, off, off, on, gap]).ravel(),
+        y=np.tile([0, 1, 1, 0, 0, np.nan], len(bounds)),
+        yaxis='y',
+        mode='lines',
+        fill='toself',
+        fillcolor=color,
+        opacity=opacity,
+        line=dict(color=color, width=0),
+        name=name,
+        legendgroup=legendgroup or name,
+        hoverinfo='skip'
+    )
+
 def generate_average_plot(sensor, epochs_on, epochs_off, avg_on, avg_off, before, after, fps, color_map, event_color=None, color_overrides=None):
     """
     Generate average plots for ON and OFF epochs.
@@ -17,8 +146,8 @@ def generate_average_plot(sensor, epochs_on, epochs_off, avg_on, avg_off, before
     If epochs_on is a list, the function behaves as before.
     """
     print('color overrides in generate_average_plot:', color_overrides)
-    # Create common x-axis based on the epoch window and fps.
-    x = np.arange(-before, after, 1 / fps)
+    # Create common x-axis based on the epoch window and fps (same samples as MergeDatasets.get_epoch_tensor).
+    x = (np.arange(int(before * fps) + int(after * fps)) - int(before * fps)) / fps
 
     if color_overrides is None:
         color_overrides = {}
@@ -212,94 +341,93 @@ def generate_average_plot(sensor, epochs_on, epochs_off, avg_on, avg_off, before
     
     return fig_on, fig_off, avg_change_on, avg_change_off
 
-def generate_plots(object, mergeddataset, freezing_intervals, fps, before, after, epochs_acc_on, epochs_acc_off, avg_on, avg_off, event, event_colors, name='ACC'):
+def generate_plots(object, mergeddataset, freezing_intervals, fps, before, after, epochs_acc_on, epochs_acc_off, avg_on, avg_off, event, event_colors, name='ACC', render_mode='auto'):
     """
     Generate detailed plots for the given sensor:
       - The full signals figure 
       - The interval_on figure (with multiple onsets + mean) 
       - The interval_off figure (with multiple offsets + mean)
+
+    `epochs_acc_on` and `epochs_acc_off` are the (epochs, times, intervals) tuples
+    returned by MergeDatasets.get_epoch_tensor. `render_mode` ('auto', 'svg' or 'webgl')
+    selects the trace type of the full signals (see scatter_type).
     """
     # [Original code remains unchanged...]
-    fig = go.Figure(layout_yaxis_range=[-5, 5])
+    fig = go.Figure()
+    band_axes(fig, range=[-5, 5])
     interval_on = go.Figure(layout_yaxis_range=[-4, 4])
     interval_off = go.Figure(layout_yaxis_range=[-4, 4])
     avg_change = go.Figure(layout_yaxis_range=[-2, 2])
-    x = np.arange(0, len(mergeddataset) / fps, 1 / fps)
+    # Full signals, decimated for the overview (the page fetches full resolution when zooming in)
+    (x_signal, signal), (x_control, control), (x_zdff, zdff) = signal_window(
+        mergeddataset, [f'{name}.signal', f'{name}.control', f'{name}.zdFF'])
+    Scatter = scatter_type(3 * len(mergeddataset), render_mode)
     
-    # Full signals
-    fig.add_trace(go.Scatter(
-        x=x, 
-        y=mergeddataset[f'{name}.signal'], 
+    fig.add_trace(Scatter(
+        x=x_signal, 
+        y=signal, 
         mode='lines', 
-        name=f'{name} Signal', 
+        name=f'{name} Signal',
+        yaxis='y2',
         line=dict(color='gray', width=1, dash='solid'), 
         opacity=0.5
     ))
-    fig.add_trace(go.Scatter(
-        x=x, 
-        y=mergeddataset[f'{name}.control'], 
+    fig.add_trace(Scatter(
+        x=x_control, 
+        y=control, 
         mode='lines', 
-        name=f'{name} Control', 
+        name=f'{name} Control',
+        yaxis='y2',
         line=dict(color='gray', width=1, dash='solid'), 
         opacity=0.5
     ))
-    fig.add_trace(go.Scatter(
-        x=x, 
-        y=mergeddataset[f'{name}.zdFF'], 
+    fig.add_trace(Scatter(
+        x=x_zdff, 
+        y=zdff, 
         mode='lines', 
-        name=f'{name} zdFF', 
+        name=f'{name} zdFF',
+        yaxis='y2',
         line=dict(color='blue', width=2, dash='solid')
     ))
-    fig.update_layout(title=f'{name} Signal, Control, and zdFF', xaxis_title='Time (s)', yaxis_title='Value')
+    # keep the zoom when the traces are replaced with the data of the zoomed window
+    fig.update_layout(title=f'{name} Signal, Control, and zdFF', xaxis_title='Time (s)', yaxis2_title='Value',
+                      uirevision=name)
     
     
-    # Highlight all freezing intervals
-    for on, off in freezing_intervals:
-        on_sec = on / fps
-        off_sec = off / fps
-        fig.add_vrect(name='freezing bouts', x0=on_sec, x1=off_sec, fillcolor='lightblue', opacity=0.3, layer='below', line_width=0,
-                      legendgroup='freezing bouts', showlegend=True)
+    # Highlight all freezing intervals, one band trace per event type (drawn behind the signal traces)
+    time = mergeddataset['Time(s)'].to_numpy()
+    if len(freezing_intervals):
+        fig.add_trace(event_band(freezing_intervals, time, fps, 'lightblue', 'freezing bouts', opacity=0.3))
 
     for i, e in enumerate(object.events):
         if e != 'freezing':
             event_intervals = object.get_freezing_intervals(0, e)
-            for on, off in event_intervals:
-                on_sec = on / fps
-                off_sec = off / fps
-                fig.add_vrect(name=f'{e}', x0=on_sec, x1=off_sec, fillcolor=event_colors[e], opacity=0.2, layer='below', line_width=0,
-                              legendgroup=f'{e}', showlegend=True)
+            if len(event_intervals):
+                fig.add_trace(event_band(event_intervals, time, fps, event_colors[e], f'{e}', opacity=0.2))
     
     # Build the interval_on and interval_off figures
-    aggregate_on = []
-    aggregate_off = []
+    aggregate_on, x_epoch, intervals_on = epochs_acc_on
+    aggregate_off, x_epoch_off, _ = epochs_acc_off
     
-    for i, inter in enumerate(epochs_acc_on):
-        x_epoch = np.arange(-before, after, 1 / fps)
-        y_epoch = inter[2]
+    for i, y_epoch in enumerate(aggregate_on):
         interval_on.add_trace(go.Scatter(
             x=x_epoch, y=y_epoch, name=f'onset {i+1}', mode='lines', 
             line=dict(color='gray', width=1, dash='solid'), opacity=0.5
         ))
-        aggregate_on.append(y_epoch)
-        fig.add_vrect(
-            x0=inter[1][0] / fps, x1=inter[1][1] / fps, fillcolor='blue' if event=='freezing' else event_colors[event], 
-            opacity=0.2, layer='below', line_width=0,
-            name=f'{e}' if event != 'freezing' else 'freezing bouts in analysis',
-            legendgroup='freezing bouts in analysis' if event=='freezing' else f'{e}',
-            showlegend=True
-        )
+    if len(intervals_on):
+        fig.add_trace(event_band(
+            intervals_on, time, fps, 'blue' if event=='freezing' else event_colors[event],
+            'freezing bouts in analysis' if event=='freezing' else f'{event}', opacity=0.2,
+            legendgroup='freezing bouts in analysis' if event=='freezing' else f'{event}'
+        ))
     
-    for i, inter in enumerate(epochs_acc_off):
-        x_epoch = np.arange(-before, after, 1 / fps)
-        y_epoch = inter[2]
+    for i, y_epoch in enumerate(aggregate_off):
         interval_off.add_trace(go.Scatter(
-            x=x_epoch, y=y_epoch, name=f'offset {i+1}', mode='lines', 
+            x=x_epoch_off, y=y_epoch, name=f'offset {i+1}', mode='lines', 
             line=dict(color='gray', width=1, dash='solid'), opacity=0.5
         ))
-        aggregate_off.append(y_epoch)
     
     # Compute mean & std for onsets
-    aggregate_on = np.array(aggregate_on)
     if len(aggregate_on) > 0:
         mean_on = np.mean(aggregate_on, axis=0)
         std_on = np.std(aggregate_on, axis=0)
@@ -319,27 +447,26 @@ def generate_plots(object, mergeddataset, freezing_intervals, fps, before, after
                               opacity=0.3, layer='below', line_width=0)
     
     # Compute mean & std for offsets
-    aggregate_off = np.array(aggregate_off)
     if len(aggregate_off) > 0:
         mean_off = np.mean(aggregate_off, axis=0)
         std_off = np.std(aggregate_off, axis=0)
         interval_off.add_trace(go.Scatter(
-            x=x_epoch, y=mean_off, mode='lines', name='mean signal', 
+            x=x_epoch_off, y=mean_off, mode='lines', name='mean signal', 
             line=dict(color='blue', width=2, dash='solid')
         ))
         interval_off.add_trace(go.Scatter(
-            x=x_epoch, y=mean_off + std_off, hoverinfo="skip", fillcolor='rgba(0, 0, 255, 0.1)',
+            x=x_epoch_off, y=mean_off + std_off, hoverinfo="skip", fillcolor='rgba(0, 0, 255, 0.1)',
             line=dict(color='rgba(255,255,255,0)'), showlegend=False
         ))
         interval_off.add_trace(go.Scatter(
-            x=x_epoch, y=mean_off - std_off, fill='tonexty', hoverinfo="skip",
+            x=x_epoch_off, y=mean_off - std_off, fill='tonexty', hoverinfo="skip",
             fillcolor='rgba(0, 0, 255, 0.1)', line=dict(color='rgba(255,255,255,0)'), showlegend=False
         ))
         interval_off.add_vrect(x0=-before, x1=0, fillcolor='lightblue' if event=='freezing' else event_colors[event],
                                opacity=0.3, layer='below', line_width=0)
     
     # Bar plot for the zdFF change
-    if avg_on and avg_off:
+    if len(avg_on) and len(avg_off):
         avg_on = np.array(avg_on)
         avg_off = np.array(avg_off)
         avg_change.add_trace(go.Scatter(
@@ -401,25 +528,26 @@ def generate_plots(object, mergeddataset, freezing_intervals, fps, before, after
     
     return fig, interval_on, interval_off, avg_change
 
-def generate_separated_plot(object, sensor, offset, epochs_on, mergeddataset, fps, freezing_intervals, seconds_after, event, event_colors):
+def generate_separated_plot(object, sensor, offset, epochs_on, mergeddataset, fps, freezing_intervals, seconds_after, event, event_colors, render_mode='auto'):
     """
     Generate a separated plot for a given sensor (e.g., 'ACC' or 'ADN').
 
     - `offset`: fixed value to subtract from the control channel.
-    - `epochs_on`: the onset epoch data (used to add additional shading).
+    - `epochs_on`: the onset (epochs, times, intervals) tuple from MergeDatasets.get_epoch_tensor (used to add additional shading).
     - `mergeddataset`: the merged dataframe containing the sensor data.
     - `fps`: frames per second.
     - `intervals`: freezing intervals.
     - `seconds_after`: used for legend text.
+    - `render_mode`: 'auto', 'svg' or 'webgl' trace type of the signal and control (see scatter_type).
     
     The function converts the sensor signal and control into a percentage of the maximum absolute zdFF,
     subtracts the offset from the control, adds traces, and replicates the freezing shading logic:
     (A) Shades all intervals with lightblue (opacity 0.3),
     (B) Shades onset epochs with blue (opacity 0.2),
-    and adds dummy legend traces. The background is set to white.
+    each as a single band trace (see event_band) drawn behind the signal traces. The background is set to white.
     """
     fig = go.Figure()
-    x_vals = np.arange(0, len(mergeddataset) / fps, 1 / fps)
+    x_vals = mergeddataset['Time(s)'].to_numpy()
     
     zdff = mergeddataset[f'{sensor}.zdFF']
     max_z = np.max(np.abs(zdff)) if np.max(np.abs(zdff)) != 0 else 1
@@ -431,63 +559,54 @@ def generate_separated_plot(object, sensor, offset, epochs_on, mergeddataset, fp
     
     # Subtract the fixed offset from the control channel
     control_percent = control_percent - offset
+
+    # Decimate both traces for display
+    signal_index = minmax_indices(signal_percent)
+    control_index = minmax_indices(control_percent)
+    Scatter = scatter_type(len(signal_percent) + len(control_percent), render_mode)
      
-    fig.add_trace(go.Scatter(
-        x=x_vals,
-        y=signal_percent,
+    fig.add_trace(Scatter(
+        x=x_vals[signal_index],
+        y=signal_percent.to_numpy()[signal_index],
         mode='lines',
         name=f'{sensor} Signal',
+        yaxis='y2',
         line=dict(color='blue', width=1, dash='solid'),
 
     ))
-    fig.add_trace(go.Scatter(
-        x=x_vals,
-        y=control_percent,
+    fig.add_trace(Scatter(
+        x=x_vals[control_index],
+        y=control_percent.to_numpy()[control_index],
         mode='lines',
         name=f'{sensor} Control',
+        yaxis='y2',
         line=dict(color='gray', width=1, dash='solid'), 
         opacity=0.5
     ))
 
 
+    overall_min = min(signal_percent.min(), control_percent.min()) - 5
+    overall_max = max(signal_percent.max(), control_percent.max()) + 5
+
+    # Event shading, one band trace per event type (drawn behind the signal traces)
     for i, e in enumerate(object.events):
         if e != 'freezing':
             event_intervals = object.get_freezing_intervals(0, e)
-            for on, off in event_intervals:
-                on_sec = on / fps
-                off_sec = off / fps
-                fig.add_vrect(x0=on_sec, x1=off_sec, fillcolor=event_colors[e], opacity=0.2, layer='below', line_width=0,
-                              legendgroup=f'{e}', showlegend=True, name=f'{e}')
+            if len(event_intervals):
+                fig.add_trace(event_band(event_intervals, x_vals, fps, event_colors[e], f'{e}', opacity=0.2))
      
     # (A) Shade all freezing intervals with lightblue (opacity 0.3)
-    for on_time, off_time in freezing_intervals:
-        fig.add_vrect(
-            x0=on_time / fps,
-            x1=off_time / fps,
-            fillcolor='lightblue',
-            opacity=0.3,
-            layer='below',
-            line_width=0,
-            legendgroup='freezing bouts',
-            showlegend=True,
-            name='freezing bouts'
-        )
-    for inter in epochs_on:
-        fig.add_vrect(
-            x0=inter[1][0] / fps, 
-            x1=inter[1][1] / fps, 
-            fillcolor='blue' if event=='freezing' else event_colors[event], 
-            opacity=0.2, 
-            layer='below', 
-            line_width=0,
-            legendgroup='freezing bouts in analysis' if event=='freezing' else f'{event}',
-            showlegend=True,
-            name='freezing bouts in analysis'
-        )
+    if len(freezing_intervals):
+        fig.add_trace(event_band(freezing_intervals, x_vals, fps, 'lightblue', 'freezing bouts', opacity=0.3))
+    # (B) Shade the onset epochs used in the analysis
+    if len(epochs_on[2]):
+        fig.add_trace(event_band(
+            epochs_on[2], x_vals, fps, 'blue' if event=='freezing' else event_colors[event],
+            'freezing bouts in analysis', opacity=0.2,
+            legendgroup='freezing bouts in analysis' if event=='freezing' else f'{event}'
+        ))
      
-    overall_min = min(signal_percent.min(), control_percent.min()) - 5
-    overall_max = max(signal_percent.max(), control_percent.max()) + 5
-    fig.update_yaxes(range=[overall_min, overall_max], showticklabels=False)
-    fig.update_layout(title='', xaxis_title='Time (s)', yaxis_title=f'% of {sensor} zdFF',
+    band_axes(fig, range=[overall_min, overall_max], showticklabels=False, title=f'% of {sensor} zdFF')
+    fig.update_layout(title='', xaxis_title='Time (s)',
                     paper_bgcolor='white', plot_bgcolor='white')
     return fig
\ No newline at end of file
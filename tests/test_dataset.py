@@ -0,0 +1,104 @@
+import os
+import sys
+import numpy as np
+import pytest
+from scipy.ndimage import convolve1d
+
+# the dataset module is imported from the code folder, as the stdlib code module shadows the package here
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'code'))
+from dataset import BehaviorDataset, PhotometryDataset, read_behavior_csv, read_photometry_csv
+
+
+def detect_freezing_loop(velocity, window_width=5, threshold=6):
+    """
+    BehaviorDataset.detect_freezing before it was vectorized, one window mean per frame.
+    """
+    head_freezing = np.zeros(len(velocity))
+    for i in range(window_width, len(velocity)):
+        if velocity[max(i - (window_width//2), 0):min(i + (window_width//2), len(velocity))].mean() < threshold:
+            head_freezing[i] = 1
+    kernel = np.ones(10)
+    head_freezing = convolve1d(head_freezing, kernel, mode='constant')
+    return head_freezing > 2
+
+
+def random_walk_velocity(rng, n, nan_gaps=False):
+    """
+    Velocity of a synthetic trajectory: a 2D random walk with still phases, optionally with NaN gaps.
+    """
+    steps = rng.standard_normal((n + 1, 2)) * rng.uniform(0.5, 20)
+    steps[rng.random(n + 1) < 0.5] *= 0.01
+    position = np.cumsum(steps, axis=0)
+    velocity = np.sqrt(np.diff(position[:, 0])**2 + np.diff(position[:, 1])**2)
+    if nan_gaps:
+        for start in rng.integers(0, n, 3):
+            velocity[start:start + rng.integers(1, 20)] = np.nan
+    return velocity
+
+
+@pytest.mark.filterwarnings('ignore::RuntimeWarning')
+@pytest.mark.parametrize('seed', range(20))
+@pytest.mark.parametrize('nan_gaps', [False, True])
+def test_detect_freezing_matches_loop(seed, nan_gaps):
+    rng = np.random.default_rng(seed)
+    velocity = random_walk_velocity(rng, int(rng.integers(1, 1500)), nan_gaps)
+    behavior = BehaviorDataset.__new__(BehaviorDataset)
+    for window_width in (1, 2, 3, 5, 8, 15):
+        for threshold in (1, 6, 30):
+            expected = detect_freezing_loop(velocity, window_width, threshold)
+            result = behavior.detect_freezing(velocity, window_width, threshold)
+            assert np.array_equal(result, expected), (window_width, threshold)
+
+
+def smooth_signal_convolve(x, window_len=10, window='flat'):
+    """
+    PhotometryDataset.smooth_signal before it was vectorized: reflected ends and np.convolve.
+    """
+    s = np.r_[x[window_len-1:0:-1], x, x[-2:-window_len-1:-1]]
+    w = np.ones(window_len, 'd') if window == 'flat' else getattr(np, window)(window_len)
+    y = np.convolve(w/w.sum(), s, mode='valid')
+    return y[(int(window_len/2)-1):-int(window_len/2)]
+
+
+@pytest.mark.parametrize('window', ['flat', 'hanning', 'hamming', 'bartlett', 'blackman'])
+@pytest.mark.parametrize('window_len', [3, 4, 10, 11, PhotometryDataset.FFT_WINDOW - 1, PhotometryDataset.FFT_WINDOW,
+                                        PhotometryDataset.FFT_WINDOW + 1, 100, 101])
+def test_smooth_signals_matches_convolve(window, window_len):
+    rng = np.random.default_rng(window_len)
+    data = np.cumsum(rng.standard_normal((500, 3)), axis=0)
+    photometry = PhotometryDataset.__new__(PhotometryDataset)
+
+    expected = np.column_stack([smooth_signal_convolve(data[:, i], window_len, window) for i in range(data.shape[1])])
+    result = photometry.smooth_signals(data, window_len, window)
+    assert result.shape == expected.shape
+    np.testing.assert_allclose(result, expected, rtol=1e-12, atol=1e-12)
+    np.testing.assert_allclose(photometry.smooth_signal(data[:, 0], window_len, window), expected[:, 0],
+                               rtol=1e-12, atol=1e-12)
+
+
+@pytest.mark.parametrize('engine', ['c', 'pyarrow'])
+def test_read_csv_columns(tmp_path, engine):
+    if engine == 'pyarrow':
+        pytest.importorskip('pyarrow')
+    photometry_path = tmp_path / 'recording.csv'
+    photometry_path.write_text('Time(s),AIn-1,channel1_470,DI/O-1,channel1_410\n'
+                               '0.0,9,1.5,0,2.5\n'
+                               '0.1,9,1.6,1,2.6\n')
+    df, stats = read_photometry_csv(str(photometry_path), {'channel1_410': 'ACC.control', 'channel1_470': 'ACC.signal'},
+                                    engine=engine)
+    assert sorted(df.columns) == ['ACC.control', 'ACC.signal', 'DI/O-1', 'Time(s)']
+    assert df['ACC.control'].tolist() == [2.5, 2.6] and df['ACC.signal'].tolist() == [1.5, 1.6]
+    assert df['DI/O-1'].tolist() == [0, 1] and stats['rows'] == 2 and stats['engine'] == engine
+
+    # body parts in another order than BODY_PARTS, with skipped columns in between
+    behavior_path = tmp_path / 'behavior.csv'
+    parts = ['base tail', 'ear L', 'head', 'middle tail']
+    behavior_path.write_text('scorer,' + ','.join(['DLC'] * 12) + '\n'
+                             'bodyparts,' + ','.join(part for part in parts for _ in range(3)) + '\n'
+                             'coords,' + ','.join(['x', 'y', 'likelihood'] * 4) + '\n'
+                             '0,' + ','.join(str(i) for i in range(12)) + '\n'
+                             '1,' + ','.join(str(i + 100) for i in range(12)) + '\n')
+    df, stats = read_behavior_csv(str(behavior_path), engine=engine)
+    assert list(df.columns) == ['head_x', 'head_y', 'tail_x', 'tail_y', 'base_x', 'base_y']
+    assert df.iloc[0].tolist() == [6, 7, 9, 10, 0, 1]
+    assert df.iloc[1].tolist() == [106, 107, 109, 110, 100, 101]
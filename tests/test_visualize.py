@@ -0,0 +1,41 @@
+import os
+import sys
+from types import SimpleNamespace
+import numpy as np
+import pandas as pd
+import plotly.graph_objs as go
+import pytest
+
+# the visualize module is imported from the code folder, as the stdlib code module shadows the package here
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'code'))
+from visualize import LOD_POINTS, generate_separated_plot
+
+
+def session(seconds, fps=30, seed=0):
+    """
+    Merged dataframe of one region with random signals.
+    """
+    rng = np.random.default_rng(seed)
+    n = seconds * fps
+    return pd.DataFrame({'Time(s)': np.arange(n) / fps, 'ACC.zdFF': rng.standard_normal(n),
+                         'ACC.signal': rng.standard_normal(n), 'ACC.control': rng.standard_normal(n)})
+
+
+def separated_plot(df, render_mode):
+    merged = SimpleNamespace(events=['freezing'])
+    return generate_separated_plot(merged, 'ACC', 200, (None, None, []), df, 30, [], 10, 'freezing', {},
+                                   render_mode=render_mode)
+
+
+@pytest.mark.parametrize('seconds, expected', [(60, go.Scatter), (3600, go.Scattergl)])
+def test_auto_render_mode_follows_session_length(seconds, expected):
+    fig = separated_plot(session(seconds), 'auto')
+    assert [type(trace) for trace in fig.data] == [expected, expected]
+    # the traces are still decimated to about LOD_POINTS points
+    assert all(len(trace.x) <= LOD_POINTS + 2 for trace in fig.data)
+
+
+@pytest.mark.parametrize('render_mode, expected', [('svg', go.Scatter), ('webgl', go.Scattergl)])
+def test_fixed_render_mode(render_mode, expected):
+    fig = separated_plot(session(3600), render_mode)
+    assert [type(trace) for trace in fig.data] == [expected, expected]